@@ -1,29 +1,207 @@
 # -*- coding: utf-8 -*-`
 
 
-from itertools import izip
+import logging
 import endpoints
 from protorpc import remote, messages
 from google.appengine.api import memcache
-from google.appengine.api import taskqueue
-from models import User, Game, Score
+from google.appengine.api.datastore_errors import TransactionFailedError
+from google.appengine.ext import ndb
+from models import User, Game, Score, ActiveGames, HIGH_SCORES_SIZE,\
+    HIGH_SCORES_SECONDS, MEMCACHE_MOVES_REMAINING
 from models import StringMessage, NewGameForm, GameForm, MakeMoveForm,\
-    ScoreForms, GameHistory, Performance,PerformanceForms, GamesForm
-from utils import get_by_urlsafe
+    ScoreForms, GameHistory, Performance,PerformanceForms, GamesForm,\
+    MakeMovesForm, MoveResultForm, MovesForm, UserStats, UserStatsForm,\
+    HintForm
+from utils import get_key_by_urlsafe, get_cursor
+from gamestate import is_letter
+from dictionary import DIFFICULTIES, NoMatchingWord
+from profiling import profiled
+import gamecache
+import rescache
 
 NEW_GAME_REQUEST = endpoints.ResourceContainer(NewGameForm)
 GET_GAME_REQUEST = endpoints.ResourceContainer(
     urlsafe_game_key=messages.StringField(1),
     user_name=messages.StringField(2,required=True))
-GET_SCORES_LIMIT = endpoints.ResourceContainer(
-    limit=messages.IntegerField(1),)
+PAGE_REQUEST = endpoints.ResourceContainer(
+    limit=messages.IntegerField(1),
+    cursor=messages.StringField(2),)
 MAKE_MOVE_REQUEST = endpoints.ResourceContainer(
     MakeMoveForm,
     urlsafe_game_key=messages.StringField(1),)
+MAKE_MOVES_REQUEST = endpoints.ResourceContainer(
+    MakeMovesForm,
+    urlsafe_game_key=messages.StringField(1),)
 USER_REQUEST = endpoints.ResourceContainer(user_name=messages.StringField(1),
                                            email=messages.StringField(2))
+USER_PAGE_REQUEST = endpoints.ResourceContainer(
+    user_name=messages.StringField(1),
+    limit=messages.IntegerField(2),
+    cursor=messages.StringField(3),)
+
+RANKING_PAGE_SIZE = 20
+SCORES_PAGE_SIZE = 50
+GAMES_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+MOVE_RETRIES = 3
+# There are only 26 letters to guess
+MAX_MOVES = 26
+
+
+def _cached(service, endpoint, args, scope, message_type, build,
+            seconds=rescache.RESPONSE_SECONDS):
+    """Returns the response of a read-only endpoint through rescache, built
+    with build() on a miss. Endpoints can neither set response headers nor
+    send a 304, so the etag is returned in the message, and not_modified is
+    set when the request's If-None-Match header names it."""
+    headers = getattr(service.request_state, 'headers', None)
+    if_none_match = headers.get('If-None-Match') if headers else None
+    return rescache.respond(endpoint, args, scope, message_type, build,
+                            if_none_match, seconds)
+
+
+def _page_limit(request, page_size):
+    """Returns the page size asked for by request.limit, page_size if it is
+    not given, at most MAX_PAGE_SIZE"""
+    limit = min(request.limit or page_size, MAX_PAGE_SIZE)
+    if limit < 1:
+        raise endpoints.BadRequestException('Limit must be positive')
+    return limit
+
+
+def _fetch_page(query, request, page_size=SCORES_PAGE_SIZE):
+    """Fetches the page of query selected by the limit and cursor fields of
+    request. Returns the entities and the urlsafe cursor of the next page, or
+    None on the last page."""
+    entities, next_cursor, more = query.fetch_page(
+        _page_limit(request, page_size),
+        start_cursor=get_cursor(request.cursor))
+    if more and next_cursor:
+        return entities, next_cursor.urlsafe()
+    return entities, None
+
+
+def _get_user_game(request):
+    """Fetches the Game named by request.urlsafe_game_key and the User named
+    by request.user_name concurrently. Returns (game, user) or raises a
+    NotFoundException unless both exist and the game is the user's."""
+    game = gamecache.get_async(
+        get_key_by_urlsafe(request.urlsafe_game_key, Game))
+    user = User.get_by_name_async(request.user_name)
+    game, user = game.get_result(), user.get_result()
+    if user and game and user.key == game.user:
+        return game, user
+    raise endpoints.NotFoundException('Game not found!')
+
+
+def _check_guess(guess):
+    """Returns guess lower cased if it is a single letter A-Z"""
+    player_guess = guess.lower()
+    if not player_guess.isalpha():
+        raise endpoints.BadRequestException("That is not a"
+                                            " letter. Please try again.")
+    elif len(player_guess) > 1:  # check the input is signle character
+        raise endpoints.BadRequestException("That is more than one letter."
+                            "'Please try again.")
+    elif not is_letter(player_guess):
+        raise endpoints.BadRequestException("Only letters A-Z are"
+                                            " allowed. Please try again.")
+    return player_guess
+
+
+def _apply_guess(game, player_guess):
+    """Applies one checked guess to game in memory. Returns the message for
+    the player and, if the game ended, whether it was won, else None."""
+    # Return if game is already Over
+    if game.game_over:
+        raise  endpoints.ForbiddenException('Game already over!')
+    # check letter is guesssed previously
+    if game.has_guessed(player_guess):
+        raise endpoints.BadRequestException("You have already guessed that"
+                            " letter. Please try again.")
 
-MEMCACHE_MOVES_REMAINING = 'MOVES_REMAINING'
+    correct = game.guess(player_guess)
+
+    if correct and game.is_solved():
+        game.game_over = True
+        return ("\nCongratulations! You Won.'"
+                "' The word is:{}".format(game.target)), True
+
+    if not correct:
+        game.attempts_remaining -= 1
+        if game.attempts_remaining < 1:
+            game.game_over = True
+            return 'All attempts made. YouLoose', False
+
+    return ("Nice Move <{}>. Guess Other"
+            " Letter (A-Z)".format(game.masked_word())), None
+
+
+def _move(game_key, player_guesses, skip_repeats=False):
+    """Applies guesses in order, until the game ends, to the cached state of
+    the game and stores it back with compare-and-set, retrying if another
+    move got there first. The Game, with any Score and Performance, is
+    written to the datastore in one transaction when the game ends or every
+    gamecache.FLUSH_EVERY moves; if that write fails the moves stay cached
+    and a flush task retries it. When memcache can not hold the game every
+    move is written through, and retried if another move was written first.
+    With skip_repeats a letter already guessed is reported and skipped
+    rather than failing the move. Returns the Game and a (guess, applied,
+    message) tuple per guess looked at."""
+    for _ in range(MOVE_RETRIES + 1):
+        session = gamecache.load(game_key)
+        game = session.game
+        if not game:
+            raise endpoints.BadRequestException('Game Not Found!')
+        base = game.moves or ''
+        results = []
+        for player_guess in player_guesses:
+            if skip_repeats and not game.game_over and \
+                    game.has_guessed(player_guess):
+                results.append((player_guess, False,
+                                'You have already guessed that letter.'))
+                continue
+            message, won = _apply_guess(game, player_guess)
+            results.append((player_guess, True, message))
+            if won is not None:
+                break
+        if not any(applied for _, applied, _ in results):
+            # Every guess was a repeat; nothing to store
+            return game, results
+        dirty = session.dirty + 1
+        write = game.game_over or not session.cached or \
+            dirty >= gamecache.FLUSH_EVERY
+        # The entry stays counted as unwritten until the write succeeds
+        if not session.save(game, dirty):
+            continue
+        if write:
+            try:
+                found = gamecache.persist(
+                    game, None if session.cached else base)
+            except TransactionFailedError:
+                if not session.cached:
+                    continue
+                found = None
+            except Exception:
+                if not session.cached:
+                    raise
+                logging.exception('Writing game %s failed',
+                                  game_key.urlsafe())
+                found = None
+            if found is None:
+                # The moves are safe in memcache; a flush writes them later
+                gamecache.schedule_flush(game_key)
+            elif not found:
+                gamecache.forget(game_key)
+                raise endpoints.BadRequestException('Game Not Found!')
+            else:
+                session.written(game)
+        elif dirty == 1:
+            gamecache.schedule_flush(game_key)
+        rescache.bump(rescache.game_scope(game_key))
+        return game, results
+    raise TransactionFailedError('Game changed on every attempt')
 
 
 @endpoints.api(name='guess_a_number', version='v1')
@@ -34,13 +212,14 @@ class HangmanApi(remote.Service):
                       path='user',
                       name='create_user',
                       http_method='POST')
+    @profiled('create_user')
     def create_user(self, request):
         """Create a User. Requires a unique username"""
-        if User.query(User.name == request.user_name).get():
+        if not request.user_name:
+            raise endpoints.BadRequestException('Enter Valid USer Name.')
+        if not User.create(request.user_name, request.email):
             raise endpoints.ConflictException(
                 'A User with that name already exists!')
-        user = User(name=request.user_name, email=request.email)
-        user.put()
         return StringMessage(message='User {} created!'.format(
             request.user_name))
 
@@ -49,267 +228,327 @@ class HangmanApi(remote.Service):
                       path='game',
                       name='new_game',
                       http_method='POST')
+    @profiled('new_game')
     def new_game(self, request):
         """Creates new game"""
-        user = User.query(User.name == request.user_name).get()
+        user = User.get_by_name(request.user_name)
         if not user:
             raise endpoints.NotFoundException('A User with that'
                                               'name does not exist!')
+        if request.difficulty and request.difficulty not in DIFFICULTIES:
+            raise endpoints.BadRequestException(
+                'Difficulty must be one of {}'.format(', '.join(DIFFICULTIES)))
         try:
-            game = Game.new_game(user.key, request.attempts)
+            game = Game.new_game(user.key, request.attempts,
+                                 request.dictionary, request.word_length,
+                                 request.difficulty)
+        except NoMatchingWord, e:
+            raise endpoints.BadRequestException(str(e))
         except ValueError:
             raise endpoints.BadRequestException('Maximum must be greater '
                                                 'than minimum!')
-
-        # Use a task queue to update the average attempts remaining.
-        # This operation is not needed to complete the creation of a new game
-        # so it is performed out of sequence.
-        taskqueue.add(url='/tasks/cache_average_attempts')
-        return game.to_form('Good luck playing Guess a Number!')
+        return game.to_form('Good luck playing Guess a Number!', user.name)
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
                       response_message=GameForm,
                       path='game/{urlsafe_game_key}',
                       name='get_game',
                       http_method='GET')
+    @profiled('get_game')
     def get_game(self, request):
-        """Return the current game state."""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        user=User.query(User.name == request.user_name).get()
-        if user and game and user.key == game.user:
-            return game.to_form('Time to make a move!')
-        else:
-            raise endpoints.NotFoundException('Game not found!')
+        """Return the current game state. Cached until the next move, with
+        an etag to send back as If-None-Match."""
+        game_key = get_key_by_urlsafe(request.urlsafe_game_key, Game)
+
+        def build():
+            game, user = _get_user_game(request)
+            return game.to_form('Time to make a move!', user.name)
+        return _cached(self, 'get_game',
+                       (game_key.urlsafe(), request.user_name),
+                       rescache.game_scope(game_key), GameForm, build)
 
     @endpoints.method(request_message=MAKE_MOVE_REQUEST,
                       response_message=GameForm,
                       path='game/{urlsafe_game_key}',
                       name='make_move',
                       http_method='PUT')
+    @profiled('make_move')
     def make_move(self, request):
-        """Makes a move. Returns a game state with message"""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game:
-            pass
-        else:
-            raise endpoints.BadRequestException('Game Not Found!')
-        # Return if game is already Over
+        """Makes a move. Returns a game state with message. The move updates
+        the cached game with compare-and-set, retried on contention, so
+        concurrent guesses on a game can not overwrite each other."""
+        game_key = get_key_by_urlsafe(request.urlsafe_game_key, Game)
+        player_guess = _check_guess(request.guess)
+        try:
+            game, results = _move(game_key, [player_guess])
+        except TransactionFailedError:
+            raise endpoints.ConflictException('The game was changed by another'
+                                              ' move. Please try again.')
+        return game.to_form(results[0][2])
+
+    @endpoints.method(request_message=MAKE_MOVES_REQUEST,
+                      response_message=MovesForm,
+                      path='game/{urlsafe_game_key}/moves',
+                      name='make_moves',
+                      http_method='PUT')
+    @profiled('make_moves')
+    def make_moves(self, request):
+        """Makes several moves in order in one call. Guesses are applied to
+        the cached game up to the first that ends the game and stored back
+        once. Letters already guessed are skipped. Returns the result of each
+        guess looked at and the final game state."""
+        game_key = get_key_by_urlsafe(request.urlsafe_game_key, Game)
+        if not request.guesses:
+            raise endpoints.BadRequestException('No guesses given.')
+        if len(request.guesses) > MAX_MOVES:
+            raise endpoints.BadRequestException(
+                'At most {} guesses per call.'.format(MAX_MOVES))
+        player_guesses = [_check_guess(guess) for guess in request.guesses]
+        try:
+            game, results = _move(game_key, player_guesses, skip_repeats=True)
+        except TransactionFailedError:
+            raise endpoints.ConflictException('The game was changed by another'
+                                              ' move. Please try again.')
+        return MovesForm(
+            results=[MoveResultForm(guess=guess, applied=applied,
+                                    message=message)
+                     for guess, applied, message in results],
+            game=game.to_form(results[-1][2]))
+
+    @endpoints.method(request_message=GET_GAME_REQUEST,
+                      response_message=HintForm,
+                      path='game/{urlsafe_game_key}/hint',
+                      name='get_hint',
+                      http_method='GET')
+    @profiled('get_hint')
+    def get_hint(self, request):
+        """Suggests the next letter to guess: the one found in the most
+        dictionary words that still fit the game. Does not use a move."""
+        game, user = _get_user_game(request)
         if game.game_over:
-            raise  endpoints.ForbiddenException('Game already over!')
-        # get the target word from database. Target word is created during new
-        # game.
-        chosen_word = game.target
-        game_history = game.game_history
-        guessed_letters = game.letters_guessed
-        word_guessed = []
-        for i in chosen_word:
-            word_guessed.append("-")
-        player_guess = request.guess
-        player_guess = player_guess.lower()
-        if not player_guess.isalpha():
-            raise endpoints.BadRequestException("That is not a"
-                                                " letter. Please try again.")
-        elif len(player_guess) > 1:  # check the input is signle character
-            raise endpoints.BadRequestException("That is more than one letter."
-                                "'Please try again.")
-        # check letter is guesssed previously
-        elif player_guess in guessed_letters:
-            raise endpoints.BadRequestException("You have already guessed that"
-                                " letter. Please try again.")
-        else:
-            pass
-        guessed_letters.append(player_guess)
-        game.letters_guessed = guessed_letters
-
-        for letter in range(len(chosen_word)):
-            for guess in guessed_letters:
-                if guess == chosen_word[letter]:
-                    word_guessed[letter] = guess
-        joined_word = "".join(word_guessed)
-
-        if "-" not in word_guessed:
-            game.end_game(True)
-            game_history.append(
-                "Guess Made:<{}>. Result: Correct Guess".format(player_guess))
-            game.game_history = game_history
-            game.put()
-            return game.to_form(
-                "\nCongratulations! You Won.'"
-                "' The word is:{}".format(chosen_word))
-
-        if game.attempts_remaining == 1 and player_guess not in chosen_word:
-            game.attempts_remaining -= 1
-            game_history.append(
-                "Guess Made:<{}>. Result: Wrong Guess".format(player_guess))
-            game.game_history = game_history
-            game.put()
-            game.end_game(False)
-            return game.to_form('All attempts made. YouLoose')
-
-        if player_guess not in chosen_word:
-            game_history.append(
-                "Guess Made:<{}>. Result: Wrong Guess".format(player_guess))
-            game.attempts_remaining -= 1
-            game.game_history = game_history
+            raise endpoints.ForbiddenException('Game already over!')
+        # The solver builds its indexes on first use; import it only then
+        import solver
+        game.upgrade()
+        letter, candidates = solver.hint(game.dictionary_name,
+                                         game.masked_word(),
+                                         game.guessed_mask)
+        if candidates:
+            message = 'Try <{}>. {} words still fit.'.format(letter,
+                                                           candidates)
         else:
-            game_history.append(
-                "Guess Made:<{}>. Result: Correct Guess".format(player_guess))
-            game.game_history = game_history
-        game.put()
+            message = 'Try <{}>.'.format(letter)
+        return HintForm(letter=letter, candidates=candidates,
+                        message=message)
 
-        return game.to_form("Nice Move <{}>. Guess Other"
-                            " Letter (A-Z)".format(joined_word))
-
-    @endpoints.method(response_message=ScoreForms,
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=ScoreForms,
                       path='scores',
                       name='get_scores',
                       http_method='GET')
+    @profiled('get_scores')
     def get_scores(self, request):
-        """Return all scores from database"""
-        return ScoreForms(items=[score.to_form() for score in Score.query()])
+        """Return a page of scores from database. Pass the returned
+        next_cursor as cursor to get the next page. Cached until the next
+        game ends."""
+        def build():
+            scores, next_cursor = _fetch_page(Score.query(), request)
+            return ScoreForms(items=Score.to_forms(scores),
+                              next_cursor=next_cursor)
+        return _cached(self, 'get_scores', (request.limit, request.cursor),
+                       rescache.SCORES, ScoreForms, build)
 
-    @endpoints.method(request_message=USER_REQUEST,
+    @endpoints.method(request_message=USER_PAGE_REQUEST,
                       response_message=ScoreForms,
                       path='scores/user/{user_name}',
                       name='get_user_scores',
                       http_method='GET')
+    @profiled('get_user_scores')
     def get_user_scores(self, request):
-        """Returns score of an individual User"""
+        """Returns a page of scores of an individual User"""
         if request.user_name:
-            user = User.query(User.name == request.user_name).get()
+            user = User.get_by_name(request.user_name)
             if not user:
                 raise endpoints.NotFoundException(
                     'A User with that name does not exist!')
-            scores = Score.query(Score.user == user.key)
-            return ScoreForms(items=[score.to_form() for score in scores])
+            scores, next_cursor = _fetch_page(
+                Score.query(Score.user == user.key), request)
+            return ScoreForms(items=[score.to_form(user.name)
+                                     for score in scores],
+                              next_cursor=next_cursor)
         else:
             raise endpoints.BadRequestException(
                 'Enter Valid USer Name.')
 
+    @endpoints.method(request_message=USER_REQUEST,
+                      response_message=UserStatsForm,
+                      path='users/{user_name}/stats',
+                      name='get_user_stats',
+                      http_method='GET')
+    @profiled('get_user_stats')
+    def get_user_stats(self, request):
+        """Returns the summary of an individual User's finished games"""
+        user = User.get_by_name(request.user_name)
+        if not user:
+            raise endpoints.NotFoundException(
+                'A User with that name does not exist!')
+        stats = UserStats.key_for(user.key).get() or UserStats()
+        return stats.to_form(user.name)
+
     @endpoints.method(response_message=StringMessage,
                       path='games/average_attempts',
                       name='get_average_attempts_remaining',
                       http_method='GET')
+    @profiled('get_average_attempts')
     def get_average_attempts(self, request):
         """Get the cached average moves remaining"""
-        return StringMessage(
-            message=memcache.get(MEMCACHE_MOVES_REMAINING) or '')
+        message = memcache.get(MEMCACHE_MOVES_REMAINING)
+        if message is None:
+            message = self._cache_average_attempts()
+        return StringMessage(message=message)
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
                       response_message=StringMessage,
                       path='games/cancel_game/{urlsafe_game_key}',
                       name='cancel_any_game',
                       http_method='GET')
+    @profiled('cancel_game')
     def cancel_game(self, request):
         """Cancel game as per requested urlsafe_key"""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        user = User.query(User.name == request.user_name).get()
-        if user and game and user.key == game.user:
-            if game.game_over == True:
-                raise endpoints.BadRequestException('Can not cancel this'
-                                             'game as Game is already OVER.')
-            else:
-                name = game.user.get().name
-                game.key.delete()
-                return StringMessage(message='Game played by'
-                                             'User: {} Cancelled'.format(name))
+        game, user = _get_user_game(request)
+        if game.game_over == True:
+            raise endpoints.BadRequestException('Can not cancel this'
+                                         'game as Game is already OVER.')
         else:
-            raise endpoints.NotFoundException('Game not found!')
+            name = user.name
+            gamecache.forget(game.key)
+            # The counters only hold the moves written to the datastore
+            stored = game.key.get()
+            if stored:
+                ndb.Future.wait_all([
+                    game.key.delete_async(),
+                    ActiveGames.add_async(
+                        games=-1, attempts=-stored.attempts_remaining)])
+            rescache.bump(rescache.game_scope(game.key))
+            return StringMessage(message='Game played by'
+                                         'User: {} Cancelled'.format(name))
 
-    @endpoints.method(request_message=GET_SCORES_LIMIT,
+    @endpoints.method(request_message=PAGE_REQUEST,
                       response_message=ScoreForms,
                       path='games/high_scores',
                       name='get_high_scores',
                       http_method='GET')
+    @profiled('get_high_scores')
     def get_high_scores(self, request):
-        "Get scores of all users, higher scores on top"
-        limit = 5
-        if request.limit:
-            limit = request.limit
-
-        scores =\
-            Score.query().order(-Score.won).order(Score.guesses).fetch(limit)
-        if scores:
-            return ScoreForms(items=[score.to_form() for score in scores])
-        else:
-            raise endpoints.NotFoundException("Score Board Empty.")
+        """Get scores of all users, higher scores on top. The first
+        HIGH_SCORES_SIZE are served from a cached board; deeper pages are a
+        scan of the Score.sort_key index. Pages are cached until the next
+        game ends."""
+        limit = request.limit or 5
 
-    @endpoints.method(request_message=USER_REQUEST,
+        def build():
+            next_cursor = None
+            if 0 < limit <= HIGH_SCORES_SIZE and not request.cursor:
+                board = Score.top()
+                scores = [score for score, _ in board[:limit]]
+                if len(board) > limit or len(board) == HIGH_SCORES_SIZE:
+                    next_cursor = board[len(scores) - 1][1]
+            else:
+                scores, next_cursor = _fetch_page(
+                    Score.query().order(-Score.sort_key), request, limit)
+            if scores:
+                return ScoreForms(items=Score.to_forms(scores),
+                                  next_cursor=next_cursor)
+            else:
+                raise endpoints.NotFoundException("Score Board Empty.")
+        return _cached(self, 'get_high_scores', (limit, request.cursor),
+                       rescache.SCORES, ScoreForms, build,
+                       HIGH_SCORES_SECONDS)
+
+    @endpoints.method(request_message=USER_PAGE_REQUEST,
                       response_message=GamesForm,
                       path='games/user_games/{user_name}',
                       name='get_user_games',
                       http_method='GET')
+    @profiled('get_user_games')
     def get_user_games(self, request):
-        """Get the list of all active games of a users """
-        user = User.query(User.name == request.user_name).get()
+        """Get a page of the active games of a user. Reads only the key and
+        attempts remaining of each game, with a projection query, so the
+        cost does not depend on the games' move histories."""
+        user = User.get_by_name(request.user_name)
         if user:
-            game = Game.query(Game.game_over == False, Game.user == user.key)
-            if game.count():
+            games, next_cursor = _fetch_page(
+                Game.query(Game.game_over == False, Game.user == user.key,
+                           projection=[Game.attempts_remaining]),
+                request, GAMES_PAGE_SIZE)
+            if games or request.cursor:
                 return GamesForm(
-                    mess=[active.to_form("Games Stat") for active in game])
+                    mess=[GameForm(urlsafe_key=game.key.urlsafe(),
+                                   attempts_remaining=game.attempts_remaining,
+                                   game_over=False, message="Games Stat",
+                                   user_name=user.name)
+                          for game in games],
+                    next_cursor=next_cursor)
             else:
                 raise endpoints.ForbiddenException('No active'
                                                    ' game for requested User')
         else:
             raise endpoints.ForbiddenException('User Name does not Exist')
 
-    @endpoints.method(response_message=PerformanceForms,
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=PerformanceForms,
                       path='games/users_ranking',
                       name='get_users_ranking',
                       http_method='GET')
+    @profiled('get_users_ranking')
     def get_users_ranking(self, request):
-        "Get ranking of all users based on performance"
-        user=User.query()
-        entity=Performance.query()
-        for each in entity:
-            each.key.delete()
-        for each_user in user:
-            game=Score.query(Score.user == each_user.key)
-            total_performance=0.0
-            for each in game:
-                factor=0
-                if each.won == True:
-                    factor=1
-                total_performance =total_performance+(factor* each.performance)
-            each_user.add_performance(total_performance)
-        players = Performance.query().order(-Performance.performance)
-        rank_list=[]
-        count=players.count()
-        if count:
-            for player, rank in izip(players, range(count)):
-                rank_list.append(player.to_form(rank=rank+1))
-            return PerformanceForms(
-                                 ranks=rank_list)
-        else:
+        """Get ranking of all users based on performance. Performance is
+        maintained as games end, so this is a sorted, paged read."""
+        limit = _page_limit(request, RANKING_PAGE_SIZE)
+        # The rank of the first row on the page travels with the cursor as
+        # '<rank>:<cursor>' so later pages keep counting from the right place
+        rank = 0
+        cursor = None
+        if request.cursor:
+            rank, _, urlsafe = request.cursor.partition(':')
+            if not rank.isdigit():
+                raise endpoints.BadRequestException('Invalid Cursor')
+            rank = int(rank)
+            cursor = get_cursor(urlsafe)
+        players, next_cursor, more = Performance.query().order(
+            -Performance.performance).fetch_page(limit, start_cursor=cursor)
+        if not players and not rank:
             raise endpoints.NotFoundException("Performance board Empty")
-
+        rank_list = [player.to_form(rank=rank + position + 1)
+                     for position, player in enumerate(players)]
+        form = PerformanceForms(ranks=rank_list)
+        if more and next_cursor:
+            form.next_cursor = '{}:{}'.format(rank + len(players),
+                                              next_cursor.urlsafe())
+        return form
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
                       response_message=GameHistory,
                       path='games/games_history/{urlsafe_game_key}',
                       name='get_games_history',
                       http_method='GET')
+    @profiled('get_games_history')
     def get_games_history(self, request):
-        "Get history of all moves of all games."
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        user = User.query(User.name == request.user_name).get()
-        if user and game and user.key == game.user:
-            return game.to_form_game()
-        else:
-            raise endpoints.NotFoundException('Game not found!')
+        "Get history of all moves of all games. Cached until the next move."
+        game_key = get_key_by_urlsafe(request.urlsafe_game_key, Game)
+
+        def build():
+            game, user = _get_user_game(request)
+            return game.to_form_game(user.name)
+        return _cached(self, 'get_games_history',
+                       (game_key.urlsafe(), request.user_name),
+                       rescache.game_scope(game_key), GameHistory, build)
 
     @staticmethod
+    @profiled('_cache_average_attempts')
     def _cache_average_attempts():
-        """Populates memcache with the average moves remaining of Games"""
-        games = Game.query(Game.game_over == False).fetch()
-        if games:
-            count = len(games)
-            total_attempts_remaining = sum([game.attempts_remaining
-                                            for game in games])
-            average = float(total_attempts_remaining)/count
-            memcache.set(MEMCACHE_MOVES_REMAINING,
-                         'The average moves '
-                         'remaining is {:.2f}'.format(average))
-
+        """Populates memcache with the average moves remaining of Games from
+        the ActiveGames counters and returns the message"""
+        return ActiveGames.cache_average()
 
 api = endpoints.api_server([HangmanApi])
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""benchmark.py - Local load test of the game API against the App Engine
+testbed stubs.
+
+Seeds users, games and scores, then drives each workload through the real
+HangmanApi methods and task handlers, recording throughput, p50/p99 latency
+and datastore/memcache RPC counts per endpoint. Results are written as JSON
+so a later run can be compared against a saved baseline:
+
+    python benchmark.py --sdk ~/google_appengine --output baseline.json
+    python benchmark.py --sdk ~/google_appengine --compare baseline.json
+
+The stubs run in process, so absolute latencies are only comparable between
+runs on the same machine; RPC counts are exact."""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def setup_sdk(sdk_path):
+    "Puts the App Engine SDK and its bundled libraries on sys.path"
+    sys.path.insert(0, sdk_path)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, ROOT)
+
+
+def start_testbed():
+    "Activates the service stubs the app uses and returns the testbed"
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1))
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=ROOT)
+    bed.init_mail_stub()
+    bed.init_app_identity_stub()
+    bed.init_urlfetch_stub()
+    return bed
+
+
+def percentile(values, fraction):
+    "Returns the value at fraction of the sorted values"
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class Recorder(object):
+    "Collects one sample per call of each endpoint"
+
+    def __init__(self):
+        self.samples = {}
+
+    def call(self, name, func, *args):
+        """Runs func(*args) as one request - a fresh ndb context cache - and
+        records its wall time and RPC counts. Returns func's result, or None
+        if it raised an endpoints error, which is counted."""
+        from google.appengine.ext import ndb
+        from protorpc import remote
+        import profiling
+        ndb.get_context().clear_cache()
+        result = None
+        with profiling.recording() as sample:
+            try:
+                result = func(*args)
+            except remote.ApplicationError:
+                sample['errors'] = 1
+        self.samples.setdefault(name, []).append(sample)
+        return result
+
+    def summary(self):
+        "Returns {endpoint: statistics} for everything recorded"
+        summary = {}
+        for name, samples in sorted(self.samples.iteritems()):
+            walls = [sample['wall_ms'] for sample in samples]
+            total_ms = sum(walls)
+            count = len(samples)
+            entry = {
+                'calls': count,
+                'errors': sum(sample.get('errors', 0) for sample in samples),
+                'ops_per_second': count / (total_ms / 1000.0) if total_ms
+                else 0.0,
+                'p50_ms': percentile(walls, 0.5),
+                'p99_ms': percentile(walls, 0.99),
+            }
+            for counter in ('get', 'put', 'query', 'entity_bytes',
+                            'memcache_get', 'memcache_hit'):
+                entry[counter + '_per_call'] = \
+                    sum(sample[counter] for sample in samples) / float(count)
+            summary[name] = entry
+        return summary
+
+
+def seed(users, games_per_user, finished_per_user):
+    """Creates users, each with active games and finished games (and so
+    Scores). Returns the user names and an (owner name, urlsafe key) pair
+    per active game."""
+    from models import User, Game
+    names = []
+    active = []
+    for index in range(users):
+        name = 'bench-user-{}'.format(index)
+        user = User.create(name, '{}@example.com'.format(name))
+        names.append(name)
+        for _ in range(games_per_user):
+            active.append((name, Game.new_game(user.key, 6).key.urlsafe()))
+        for _ in range(finished_per_user):
+            play_out(Game.new_game(user.key, 6), random.random() < 0.5)
+    return names, active
+
+
+def play_out(game, won):
+    """Guesses letters of the target, or letters not in it, until game is
+    won or lost, and writes it the way a final move does"""
+    import gamecache
+    letters = [letter for letter in string.ascii_lowercase
+               if (letter in game.target) == won]
+    random.shuffle(letters)
+    for letter in letters:
+        if not game.guess(letter):
+            game.attempts_remaining -= 1
+        if game.is_solved() or game.attempts_remaining < 1:
+            break
+    game.game_over = True
+    gamecache.persist(game)
+
+
+def guess_stream(api, recorder, urlsafe_key, guesses):
+    "Plays up to guesses random letters into a game"
+    import api as api_module
+    request_class = api_module.MAKE_MOVE_REQUEST.combined_message_class
+    letters = list(string.ascii_lowercase)
+    random.shuffle(letters)
+    for letter in letters[:guesses]:
+        form = recorder.call('make_move', api.make_move,
+                             request_class(urlsafe_game_key=urlsafe_key,
+                                           guess=letter))
+        if form is None or form.game_over:
+            break
+
+
+def run(options):
+    "Runs every workload and returns the summary"
+    import api as api_module
+    import main
+    from protorpc import message_types
+    random.seed(options.seed)
+    recorder = Recorder()
+    names, active = seed(options.users, options.games, options.scores)
+    service = api_module.HangmanApi()
+    containers = dict(
+        (name, getattr(api_module, name).combined_message_class)
+        for name in ('NEW_GAME_REQUEST', 'GET_GAME_REQUEST', 'PAGE_REQUEST',
+                     'USER_PAGE_REQUEST'))
+
+    for _ in range(options.iterations):
+        name = random.choice(names)
+        form = recorder.call('new_game', service.new_game,
+                             containers['NEW_GAME_REQUEST'](
+                                 user_name=name, attempts=6))
+        if form is not None:
+            guess_stream(service, recorder, form.urlsafe_key,
+                         options.guesses)
+        owner, urlsafe_key = random.choice(active)
+        recorder.call('get_game', service.get_game,
+                      containers['GET_GAME_REQUEST'](
+                          urlsafe_game_key=urlsafe_key,
+                          user_name=owner))
+        recorder.call('get_high_scores', service.get_high_scores,
+                      containers['PAGE_REQUEST'](limit=10))
+        recorder.call('get_scores', service.get_scores,
+                      containers['PAGE_REQUEST']())
+        recorder.call('get_user_scores', service.get_user_scores,
+                      containers['USER_PAGE_REQUEST'](user_name=name))
+        recorder.call('get_users_ranking', service.get_users_ranking,
+                      containers['PAGE_REQUEST']())
+        recorder.call('get_average_attempts', service.get_average_attempts,
+                      message_types.VoidMessage())
+        recorder.call('_cache_average_attempts',
+                      api_module.HangmanApi._cache_average_attempts)
+
+    for _ in range(options.cron_runs):
+        recorder.call('cron.reminder_fan_out', lambda: main.app.get_response(
+            '/tasks/reminders/fan_out', method='POST'))
+    return recorder.summary()
+
+
+def compare(baseline, summary):
+    "Prints the change of each metric against a baseline summary"
+    for name, entry in sorted(summary.iteritems()):
+        before = baseline.get(name)
+        if not before:
+            print '{:<28} new'.format(name)
+            continue
+        changes = []
+        for metric in ('p50_ms', 'p99_ms', 'get_per_call', 'put_per_call',
+                       'query_per_call'):
+            old, new = before.get(metric, 0), entry[metric]
+            if old:
+                changes.append('{} {:+.0%}'.format(metric, (new - old) / old))
+            elif new:
+                changes.append('{} 0 -> {:.2f}'.format(metric, new))
+        print '{:<28} {}'.format(name, ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'),
+                        help='path of the App Engine Python SDK')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--games', type=int, default=3,
+                        help='active games seeded per user')
+    parser.add_argument('--scores', type=int, default=5,
+                        help='finished games seeded per user')
+    parser.add_argument('--iterations', type=int, default=100,
+                        help='rounds of the mixed workload')
+    parser.add_argument('--guesses', type=int, default=10,
+                        help='most guesses made in each new game')
+    parser.add_argument('--cron-runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='baseline results to compare with')
+    options = parser.parse_args()
+    if not options.sdk:
+        parser.error('--sdk or APPENGINE_SDK is required')
+
+    setup_sdk(options.sdk)
+    bed = start_testbed()
+    try:
+        started = time.time()
+        summary = run(options)
+        elapsed = time.time() - started
+    finally:
+        bed.deactivate()
+
+    results = {'options': vars(options), 'elapsed_seconds': elapsed,
+               'endpoints': summary}
+    if options.output:
+        with open(options.output, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as source:
+            compare(json.load(source)['endpoints'], summary)
+    else:
+        print json.dumps(summary, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+
+"""bulk.py - Export and import Users, Games and Scores in bulk.
+
+Entities are written as newline delimited JSON in batches. Each batch starts
+with a header line holding its number, entity count, the SHA-1 of its entity
+lines and the query cursor after it, followed by one line per entity:
+
+    {"batch": 0, "count": 1000, "sha1": "...", "cursor": "..."}
+    {"key": [["Score", 42]], "properties": {...}}
+
+Keys are stored as paths, not urlsafe strings, so a file can be loaded into
+another application. An interrupted export is resumed from the cursor of its
+last complete batch; an import records finished batches in <file>.done and
+skips them when run again.
+
+Importing Users, Games and Scores does not create the Performance, UserStats
+and ActiveGames aggregates; post to /tasks/rebuild_performance,
+/tasks/backfill_user_stats and /tasks/rebuild_active_games afterwards.
+
+Against a local datastore file, as used by dev_appserver:
+    python bulk.py --sdk ~/google_appengine --datastore-file local.db \\
+        export Score scores.ndjson
+Against a deployed application through remote_api:
+    python bulk.py --sdk ~/google_appengine --remote my-app.appspot.com \\
+        import Score scores.ndjson --workers 8
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import Queue
+from datetime import date, datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+KINDS = ('User', 'Game', 'Score')
+# The app id dev_appserver stores the entities of app.yaml's application under
+DEV_APP_ID = 'dev~p4-refresh'
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def connect(options):
+    """Points the datastore API at a local datastore file or, with --remote,
+    at a deployed application. Returns a callable to run when done."""
+    sys.path.insert(0, options.sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, ROOT)
+    if options.remote:
+        from google.appengine.ext.remote_api import remote_api_stub
+        remote_api_stub.ConfigureRemoteApiForOAuth(options.remote,
+                                                   '/_ah/remote_api')
+        return lambda: None
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    # The datastore file keys entities by app id, so use the app's own
+    bed.setup_env(app_id=options.app_id, overwrite=True)
+    bed.init_datastore_v3_stub(datastore_file=options.datastore_file,
+                               save_changes=True, use_sqlite=True)
+    bed.init_memcache_stub()
+    return bed.deactivate
+
+
+def _key(pairs):
+    "Returns the ndb.Key of a stored key path"
+    from google.appengine.ext import ndb
+    return ndb.Key(pairs=[(str(kind), id) for kind, id in pairs])
+
+
+def encode(value):
+    "Returns a JSON-safe form of a property value"
+    from google.appengine.ext import ndb
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    if isinstance(value, ndb.Key):
+        return {'__key__': [list(pair) for pair in value.pairs()]}
+    if isinstance(value, datetime):
+        return {'__datetime__': value.strftime(DATETIME_FORMAT)}
+    if isinstance(value, date):
+        return {'__date__': value.strftime(DATE_FORMAT)}
+    if isinstance(value, str):
+        return {'__bytes__': base64.b64encode(value)}
+    return value
+
+
+def decode(value):
+    "Reverses encode"
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if isinstance(value, dict):
+        if '__key__' in value:
+            return _key(value['__key__'])
+        if '__datetime__' in value:
+            return datetime.strptime(value['__datetime__'], DATETIME_FORMAT)
+        if '__date__' in value:
+            return datetime.strptime(value['__date__'], DATE_FORMAT).date()
+        if '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+    return value
+
+
+def _stored_properties(model):
+    "Returns the names of the properties of model that can be assigned"
+    from google.appengine.ext import ndb
+    return [name for name, prop in model._properties.iteritems()
+            if not isinstance(prop, ndb.ComputedProperty)]
+
+
+def to_line(entity):
+    "Returns the JSON line of an entity"
+    properties = {}
+    for name in _stored_properties(type(entity)):
+        prop = entity._properties[name]
+        if prop._has_value(entity):
+            properties[prop._code_name] = encode(prop._get_value(entity))
+    return json.dumps({'key': [list(pair) for pair in entity.key.pairs()],
+                       'properties': properties}, sort_keys=True)
+
+
+def from_line(model, line):
+    "Returns the unsaved entity a JSON line describes"
+    data = json.loads(line)
+    entity = model(key=_key(data['key']))
+    entity.populate(**dict((str(name), decode(value))
+                           for name, value in data['properties'].iteritems()))
+    return entity
+
+
+def checksum(lines):
+    "Returns the SHA-1 of a batch's entity lines"
+    digest = hashlib.sha1()
+    for line in lines:
+        digest.update(line.encode('utf-8') if isinstance(line, unicode)
+                      else line)
+        digest.update('\n')
+    return digest.hexdigest()
+
+
+def read_batches(path):
+    """Yields (header, entity lines, file offset after the batch) for each
+    complete batch of a file and stops at a truncated one."""
+    with open(path) as source:
+        while True:
+            header = source.readline()
+            if not header.endswith('\n'):
+                return
+            header = json.loads(header)
+            lines = []
+            for _ in range(header['count']):
+                line = source.readline()
+                if not line.endswith('\n'):
+                    return
+                lines.append(line[:-1])
+            yield header, lines, source.tell()
+
+
+def export(model, path, batch_size):
+    """Writes every entity of model to path, resuming after the last complete
+    batch if path already exists."""
+    from google.appengine.ext import ndb
+    from models import iter_batches
+    batch = 0
+    cursor = None
+    valid_bytes = 0
+    if os.path.exists(path):
+        for header, lines, valid_bytes in read_batches(path):
+            batch = header['batch'] + 1
+            cursor = header['cursor']
+        if batch and not cursor:
+            print 'Export already complete'
+            return
+    start_cursor = ndb.Cursor(urlsafe=cursor) if cursor else None
+    with open(path, 'a') as out:
+        out.truncate(valid_bytes)
+        for entities, next_cursor in iter_batches(model.query(), batch_size,
+                                                  start_cursor):
+            lines = [to_line(entity) for entity in entities]
+            cursor = next_cursor.urlsafe() if next_cursor else None
+            header = {'batch': batch, 'count': len(lines),
+                      'sha1': checksum(lines), 'cursor': cursor}
+            out.write(json.dumps(header, sort_keys=True) + '\n')
+            for line in lines:
+                out.write(line + '\n')
+            out.flush()
+            print 'Exported batch {} ({} entities)'.format(batch, len(lines))
+            batch += 1
+
+
+def load(model, path, batch_size, workers):
+    """Puts the entities in path with put_multi, batch_size at a time, from
+    workers threads. Batches whose checksum does not match are reported
+    and skipped; finished batches are recorded in path.done."""
+    from google.appengine.ext import ndb
+    done_path = path + '.done'
+    done = set()
+    if os.path.exists(done_path):
+        with open(done_path) as source:
+            done = set(int(line) for line in source if line.strip())
+    work = Queue.Queue(maxsize=workers * 2)
+    lock = threading.Lock()
+    failed = []
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            header, lines = item
+            try:
+                entities = [from_line(model, line) for line in lines]
+                for start in range(0, len(entities), batch_size):
+                    ndb.put_multi(entities[start:start + batch_size])
+            except Exception, e:
+                with lock:
+                    failed.append(header['batch'])
+                    print 'Batch {} failed: {}'.format(header['batch'], e)
+                continue
+            with lock:
+                with open(done_path, 'a') as out:
+                    out.write('{}\n'.format(header['batch']))
+                print 'Imported batch {} ({} entities)'.format(
+                    header['batch'], len(lines))
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for header, lines, _ in read_batches(path):
+        if header['batch'] in done:
+            continue
+        if checksum(lines) != header['sha1']:
+            failed.append(header['batch'])
+            print 'Batch {} checksum mismatch, skipped'.format(
+                header['batch'])
+            continue
+        work.put((header, lines))
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+    if failed:
+        sys.exit('Failed batches: {}'.format(sorted(failed)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export and import Users, Games and Scores in bulk.')
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'),
+                        help='path of the App Engine Python SDK')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--datastore-file',
+                        help='local datastore file to read or write')
+    target.add_argument('--remote', help='host of a deployed application')
+    parser.add_argument('--app-id', default=DEV_APP_ID,
+                        help='app id of the entities in --datastore-file '
+                             '(default %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='parallel put_multi threads for import')
+    parser.add_argument('action', choices=('export', 'import'))
+    parser.add_argument('kind', choices=KINDS)
+    parser.add_argument('path')
+    options = parser.parse_args()
+    if not options.sdk:
+        parser.error('--sdk or APPENGINE_SDK is required')
+
+    done = connect(options)
+    try:
+        import models
+        model = getattr(models, options.kind)
+        if options.action == 'export':
+            export(model, options.path, options.batch_size)
+        else:
+            load(model, options.path, options.batch_size, options.workers)
+    finally:
+        done()
+
+
+if __name__ == '__main__':
+    main()
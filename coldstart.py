@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""coldstart.py - Measures how long a fresh instance takes to load each
+entry point of the app.
+
+Each module is imported in a new Python process, as on a cold instance, and
+the import is timed. The median over several runs is printed and can be
+saved as JSON to track the number from release to release:
+
+    python coldstart.py --sdk ~/google_appengine --output coldstart.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# main serves tasks and crons; api serves Endpoints requests
+MODULES = ('main', 'api')
+
+_TIMER = '''
+import sys, time
+sys.path.insert(0, {sdk!r})
+import dev_appserver
+dev_appserver.fix_sys_path()
+sys.path.insert(0, {root!r})
+started = time.time()
+import {module}
+print (time.time() - started) * 1000
+'''
+
+
+def time_import(sdk, module):
+    "Returns the milliseconds a fresh interpreter takes to import module"
+    output = subprocess.check_output(
+        [sys.executable, '-c', _TIMER.format(sdk=sdk, root=ROOT,
+                                             module=module)])
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time cold imports of the app entry points.')
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'),
+                        help='path of the App Engine Python SDK')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='write the results to this file')
+    options = parser.parse_args()
+    if not options.sdk:
+        parser.error('--sdk or APPENGINE_SDK is required')
+
+    results = {}
+    for module in MODULES:
+        times = sorted(time_import(options.sdk, module)
+                       for _ in range(options.runs))
+        results[module] = {'median_ms': times[len(times) // 2],
+                           'min_ms': times[0], 'max_ms': times[-1]}
+        print '{:<6} median {:.0f}ms (min {:.0f}ms, max {:.0f}ms)'.format(
+            module, results[module]['median_ms'], times[0], times[-1])
+    if options.output:
+        with open(options.output, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""dictionary.py - Word lists for new games.
+
+A dictionary file holds its words in buckets of one length and difficulty.
+Every word in a bucket has the same length, so the bucket is stored as the
+words run together without separators and word i starts at
+offset + i * length. That makes a random pick an index calculation, and the
+file is memory mapped so an instance only pages in the words it uses.
+
+File layout:
+    HANGMAN-WORDS 1
+    <number of buckets>
+    <length> <difficulty> <offset> <count>    (one line per bucket)
+    <bucket data>
+
+Build a file from a plain word list, one word per line, with:
+    python dictionary.py input.txt dictionaries/<name>.words
+"""
+
+import math
+import os
+import random
+import sys
+import threading
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+MAGIC = 'HANGMAN-WORDS 1'
+DICTIONARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'dictionaries')
+DEFAULT = 'default'
+DIFFICULTIES = ('easy', 'medium', 'hard')
+# Letter entropy, in bits, at which a word stops being easy / medium
+DIFFICULTY_ENTROPY = (2.5, 3.0)
+
+# Built in word list, used when no dictionary is asked for
+DEFAULT_WORDS = ["udacity", "education", "simple", "easy", "navjot",
+                 "university", "goooooood", "apartment", "hyundai",
+                 "mercedes", "engine", "nanodegree", "fullstack"]
+
+_dictionaries = {}
+_lock = threading.Lock()
+
+
+class NoMatchingWord(LookupError):
+    "Raised when a dictionary has no word matching the requested filters"
+
+
+def letter_entropy(word):
+    "Returns the Shannon entropy in bits of the letters of word"
+    counts = {}
+    for letter in word:
+        counts[letter] = counts.get(letter, 0) + 1
+    total = float(len(word))
+    return -sum((count / total) * math.log(count / total, 2)
+                for count in counts.itervalues())
+
+
+def difficulty(word):
+    "Returns the difficulty tier of word from its letter entropy"
+    entropy = letter_entropy(word)
+    for tier, limit in zip(DIFFICULTIES, DIFFICULTY_ENTROPY):
+        if entropy < limit:
+            return tier
+    return DIFFICULTIES[-1]
+
+
+def _bucket_words(words):
+    "Returns {(length, difficulty): sorted distinct words} for a word list"
+    buckets = {}
+    for word in set(word.strip().lower() for word in words):
+        if word and word.isalpha() and all('a' <= c <= 'z' for c in word):
+            buckets.setdefault((len(word), difficulty(word)), []).append(word)
+    for bucket in buckets.itervalues():
+        bucket.sort()
+    return buckets
+
+
+def build(words, path):
+    "Writes words to path in the dictionary file layout"
+    buckets = _bucket_words(words)
+    header = [MAGIC, str(len(buckets))]
+    data = []
+    offset = 0
+    for (length, tier), bucket in sorted(buckets.iteritems()):
+        header.append('{} {} {} {}'.format(length, tier, offset, len(bucket)))
+        data.append(''.join(bucket))
+        offset += length * len(bucket)
+    with open(path, 'wb') as out:
+        out.write('\n'.join(header) + '\n')
+        out.write(''.join(data))
+
+
+class Dictionary(object):
+    """A read only word list split into (length, difficulty) buckets. Words
+    are read straight from the backing buffer, a memory map of the
+    dictionary file or a plain string."""
+
+    def __init__(self, data, buckets, start):
+        self._data = data
+        # (length, difficulty) -> (absolute offset, count)
+        self._buckets = buckets
+        self._start = start
+
+    @classmethod
+    def from_words(cls, words):
+        "Builds an in-memory Dictionary from a list of words"
+        buckets = {}
+        data = []
+        offset = 0
+        for (length, tier), bucket in sorted(
+                _bucket_words(words).iteritems()):
+            buckets[(length, tier)] = (offset, len(bucket))
+            data.append(''.join(bucket))
+            offset += length * len(bucket)
+        return cls(''.join(data), buckets, 0)
+
+    @classmethod
+    def load(cls, path):
+        "Opens a dictionary file, memory mapping it where mmap is available"
+        with open(path, 'rb') as source:
+            if mmap is not None:
+                data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = source.read()
+        end = data.find('\n')
+        if data[:end] != MAGIC:
+            raise ValueError('{} is not a dictionary file'.format(path))
+        count_end = data.find('\n', end + 1)
+        position = count_end + 1
+        lines = []
+        for _ in range(int(data[end + 1:count_end])):
+            line_end = data.find('\n', position)
+            lines.append(data[position:line_end])
+            position = line_end + 1
+        buckets = {}
+        for line in lines:
+            length, tier, offset, count = line.split()
+            buckets[(int(length), tier)] = (position + int(offset), int(count))
+        return cls(data, buckets, position)
+
+    def __len__(self):
+        return sum(count for _, count in self._buckets.itervalues())
+
+    def lengths(self):
+        "Returns the sorted word lengths present"
+        return sorted(set(length for length, _ in self._buckets))
+
+    def _matching(self, length=None, tier=None):
+        return [(key, bucket) for key, bucket in self._buckets.iteritems()
+                if (length is None or key[0] == length) and
+                (tier is None or key[1] == tier)]
+
+    def words(self, length=None, tier=None):
+        "Yields every word matching the filters, bucket by bucket"
+        for (size, _), (offset, count) in sorted(self._matching(length,
+                                                                tier)):
+            for index in range(count):
+                start = offset + index * size
+                yield self._data[start:start + size]
+
+    def choice(self, length=None, tier=None):
+        """Returns a random word of the given length and difficulty tier,
+        either of which may be None for any. Every matching word is equally
+        likely. Raises NoMatchingWord if there is none."""
+        matching = self._matching(length, tier)
+        total = sum(count for _, (_, count) in matching)
+        if not total:
+            raise NoMatchingWord('No word matches the requested filters')
+        index = random.randrange(total)
+        for (size, _), (offset, count) in matching:
+            if index < count:
+                start = offset + index * size
+                return self._data[start:start + size]
+            index -= count
+
+
+def get(name=None):
+    """Returns the Dictionary called name, loading it from DICTIONARY_DIR the
+    first time it is asked for on this instance. None or DEFAULT gives the
+    built in word list. Raises NoMatchingWord for an unknown name."""
+    name = name or DEFAULT
+    dictionary = _dictionaries.get(name)
+    if dictionary is not None:
+        return dictionary
+    with _lock:
+        if name not in _dictionaries:
+            if name == DEFAULT:
+                _dictionaries[name] = Dictionary.from_words(DEFAULT_WORDS)
+            else:
+                if os.path.basename(name) != name:
+                    raise NoMatchingWord('Unknown dictionary')
+                path = os.path.join(DICTIONARY_DIR, name + '.words')
+                if not os.path.exists(path):
+                    raise NoMatchingWord('Unknown dictionary')
+                _dictionaries[name] = Dictionary.load(path)
+        return _dictionaries[name]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python dictionary.py input.txt output.words')
+    with open(sys.argv[1]) as source:
+        build(source, sys.argv[2])
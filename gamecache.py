@@ -0,0 +1,150 @@
+"""gamecache.py - Memcache backed state of games being played.
+
+A game in play is kept in memcache as (Game, dirty) where dirty counts the
+moves not yet written to the datastore. Moves update the cached copy with
+compare-and-set, so concurrent moves on one game can not both succeed.
+The Game is written to the datastore when it ends, every FLUSH_EVERY moves,
+and by a flush task FLUSH_SECONDS after the first unwritten move, so at most
+that much play can be lost if memcache evicts the entry first. A game
+missing from memcache is reloaded from the datastore.
+
+The ActiveGames counters follow the stored Games, not the cached ones: each
+write applies the change in attempts remaining since the stored copy in the
+same transaction, so moves themselves never touch the datastore."""
+
+from google.appengine.api import memcache, taskqueue
+from google.appengine.api.datastore_errors import TransactionFailedError
+from google.appengine.ext import ndb
+
+from models import ActiveGames
+
+MEMCACHE_GAME = 'GAME:'
+SESSION_SECONDS = 3600
+FLUSH_EVERY = 5
+FLUSH_SECONDS = 60
+
+
+def _cache_key(game_key):
+    return MEMCACHE_GAME + game_key.urlsafe()
+
+
+class Session(object):
+    """A Game read for update. cached is False when memcache could not hold
+    the game, in which case every move must be written through."""
+
+    def __init__(self, game_key, game, dirty, client, cached):
+        self.game_key = game_key
+        self.game = game
+        self.dirty = dirty
+        self.cached = cached
+        self._client = client
+
+    def save(self, game, dirty):
+        """Stores game with dirty unwritten moves if nobody changed the entry
+        since it was read. Returns False on a lost race."""
+        if not self.cached:
+            return True
+        return self._client.cas(_cache_key(self.game_key), (game, dirty),
+                                time=SESSION_SECONDS)
+
+    def written(self, game):
+        """Clears the unwritten move count after game, as saved, was written
+        to the datastore. Leaves it if a later move changed the entry, as
+        that move counts on from it and is written in turn."""
+        if not self.cached:
+            return
+        cache_key = _cache_key(self.game_key)
+        entry = self._client.gets(cache_key)
+        if entry is not None and entry[0].moves == game.moves:
+            self._client.cas(cache_key, (entry[0], 0), time=SESSION_SECONDS)
+
+
+def load(game_key):
+    "Returns a Session for the game, reloading it into memcache if evicted"
+    client = memcache.Client()
+    cache_key = _cache_key(game_key)
+    entry = client.gets(cache_key)
+    if entry is None:
+        # Bypass the context cache: moves change the Game in place, so a
+        # retry must not be handed the copy the failed attempt changed
+        game = game_key.get(use_cache=False)
+        if game is None:
+            return Session(game_key, None, 0, client, False)
+        client.add(cache_key, (game, 0), time=SESSION_SECONDS)
+        entry = client.gets(cache_key)
+        if entry is None:
+            return Session(game_key, game, 0, client, False)
+    game, dirty = entry
+    return Session(game_key, game, dirty, client, True)
+
+
+@ndb.tasklet
+def get_async(game_key):
+    "Returns a Future for the latest state of a Game, cached or stored"
+    entry = yield ndb.get_context().memcache_get(_cache_key(game_key))
+    if entry is not None:
+        raise ndb.Return(entry[0])
+    game = yield game_key.get_async()
+    raise ndb.Return(game)
+
+
+def forget(game_key):
+    "Drops a game from memcache"
+    memcache.delete(_cache_key(game_key))
+
+
+def forget_multi(game_keys):
+    "Drops several games from memcache"
+    memcache.delete_multi([_cache_key(game_key) for game_key in game_keys])
+
+
+@ndb.transactional(xg=True)
+def persist(game, base=None):
+    """Writes a cached Game to the datastore in one transaction with its
+    change to the ActiveGames counters and, if it is over, its Score,
+    Performance and UserStats. Writes nothing if the stored Game is already
+    as far on, so repeated flushes are harmless.
+
+    base is the move log a write-through move was applied to. The stored
+    Game must still have exactly that log, else TransactionFailedError is
+    raised so that the move can be retried on the newer state. Returns
+    False if the Game no longer exists."""
+    stored = game.key.get()
+    if stored is None:
+        return False
+    stored.upgrade()
+    stored_moves = stored.moves or ''
+    if base is not None and stored_moves != base:
+        raise TransactionFailedError('Game changed by another move')
+    if stored.game_over or len(stored_moves) >= len(game.moves or ''):
+        return True
+    entities = [game]
+    # ActiveGames.add joins this transaction
+    if game.game_over:
+        entities += game.finish(game.is_solved())
+        ActiveGames.add(games=-1, attempts=-stored.attempts_remaining)
+    else:
+        ActiveGames.add(
+            attempts=game.attempts_remaining - stored.attempts_remaining)
+    ndb.put_multi(entities)
+    return True
+
+
+
+def schedule_flush(game_key):
+    "Queues a write of the game's unwritten moves in FLUSH_SECONDS"
+    taskqueue.add(url='/tasks/flush_game', countdown=FLUSH_SECONDS,
+                  params={'game': game_key.urlsafe()})
+
+
+def flush(game_key):
+    """Writes the cached state of a game to the datastore if it has unwritten
+    moves. Returns False if the game changed meanwhile and needs another
+    flush."""
+    session = load(game_key)
+    if not session.cached or not session.dirty:
+        return True
+    if not persist(session.game):
+        forget(game_key)
+        return True
+    return session.save(session.game, 0)
@@ -0,0 +1,56 @@
+"""gamestate.py - Compact encoding of a Hangman game's state.
+
+Guessed letters are kept as a 26 bit mask (bit 0 is 'a') and the move log as
+a packed string of one byte per guess: the low five bits hold the letter and
+CORRECT_FLAG marks a guess that was in the target word."""
+
+import string
+
+LETTERS = string.ascii_lowercase
+CORRECT_FLAG = 0x20
+MASK_CHAR = '-'
+
+
+def is_letter(char):
+    "Returns True if char is a single lower case letter a-z"
+    return len(char) == 1 and char in LETTERS
+
+
+def letter_bit(letter):
+    "Returns the mask bit of a lower case letter"
+    return 1 << (ord(letter) - ord('a'))
+
+
+def word_mask(word):
+    "Returns the mask with the bit of every distinct letter of word set"
+    mask = 0
+    for letter in word:
+        mask |= letter_bit(letter)
+    return mask
+
+
+def mask_word(word, guessed_mask):
+    "Returns word with every letter not in guessed_mask replaced by MASK_CHAR"
+    return ''.join(letter if guessed_mask & letter_bit(letter) else MASK_CHAR
+                   for letter in word)
+
+
+def encode_move(letter, correct):
+    "Returns the one byte encoding of a guess"
+    code = ord(letter) - ord('a')
+    if correct:
+        code |= CORRECT_FLAG
+    return chr(code)
+
+
+def decode_moves(moves):
+    "Yields (letter, correct) for each guess packed in moves"
+    for byte in moves or '':
+        code = ord(byte)
+        yield LETTERS[code & 0x1f], bool(code & CORRECT_FLAG)
+
+
+def history_line(letter, correct):
+    "Returns the GameHistory text of one guess"
+    return "Guess Made:<{}>. Result: {} Guess".format(
+        letter, 'Correct' if correct else 'Wrong')
@@ -0,0 +1,70 @@
+"""lru.py - Bounded in-process cache. Kept apart from utils.py so that modules
+loaded by task handlers do not import Endpoints."""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """A bounded, thread safe in-process cache. Holds at most max_size
+    entries, evicting the least recently used, and forgets entries older than
+    ttl seconds. With max_bytes the values must be strings, and their total
+    length is kept within it too. Each instance lives as long as the App
+    Engine instance, so use it only for values that may be stale for up to
+    ttl."""
+
+    def __init__(self, max_size=1000, ttl=300, max_bytes=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _size(self, value):
+        return len(value) if self.max_bytes is not None else 0
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= self._size(entry[0])
+        return entry
+
+    def get(self, key, default=None):
+        "Returns the value cached for key, or default if missing or expired"
+        with self._lock:
+            entry = self._pop(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires < time.time():
+                return default
+            # Re-insert so the entry becomes the most recently used
+            self._entries[key] = entry
+            self._bytes += self._size(value)
+            return value
+
+    def set(self, key, value):
+        "Caches value under key, evicting the least recently used if full"
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._bytes += self._size(value)
+            while self._entries and (
+                    len(self._entries) > self.max_size or
+                    self.max_bytes is not None and
+                    self._bytes > self.max_bytes):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+
+    def delete(self, key):
+        "Forgets key"
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        "Forgets every key"
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
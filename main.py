@@ -1,45 +1,353 @@
 #!/usr/bin/env python
 
 """main.py - This file contains handlers that are called by taskqueue and/or
-cronjobs."""
+cronjobs. It does not import the Endpoints API, so instances started for
+tasks and crons do not pay for loading it."""
 
+import json
+import logging
+import time
+from datetime import datetime, timedelta
 import webapp2
-from google.appengine.api import mail, app_identity
-from api import HangmanApi
-from models import Game
+from google.appengine.api import mail, app_identity, taskqueue
+from google.appengine.ext import ndb
+import gamecache
+import rescache
+from profiling import profiled, report
+from models import User, Game, Score, Performance, ActiveGames,\
+    ArchivedGame, UserStats
+
+
+REMINDER_QUEUE = 'reminders'
 
 
 class SendReminderEmail(webapp2.RequestHandler):
+    @profiled('SendReminderEmail.get')
     def get(self):
-        """Send a reminder email to each User with an email about games.
-        Called every hour using a cron job"""
+        """Start the reminder fan-out. Called using a cron job; the work is
+        done by ReminderFanOut and SendReminderBatch tasks so the cron request
+        itself returns at once."""
+        taskqueue.add(url='/tasks/reminders/fan_out',
+                      queue_name=REMINDER_QUEUE,
+                      params={'started': time.time()})
+
+
+class ReminderFanOut(webapp2.RequestHandler):
+    PAGE_SIZE = 500
+    USERS_PER_TASK = 50
+    TIME_BUDGET = 60
+
+    @profiled('ReminderFanOut.post')
+    def post(self):
+        """Page through the distinct Users with an active game, using a
+        projection on Game.user so no Game is loaded, and enqueue one
+        SendReminderBatch task per USERS_PER_TASK users. Stops after
+        TIME_BUDGET seconds and chains itself from the cursor it reached."""
+        deadline = time.time() + self.TIME_BUDGET
+        started = float(self.request.get('started') or time.time())
+        users = int(self.request.get('users') or 0)
+        batches = int(self.request.get('batches') or 0)
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = ndb.Cursor(urlsafe=self.request.get('cursor'))
+        query = Game.query(Game.game_over == False, projection=[Game.user],
+                           distinct=True)
+        more = True
+        while more and time.time() < deadline:
+            games, cursor, more = query.fetch_page(self.PAGE_SIZE,
+                                                   start_cursor=cursor)
+            more = more and cursor is not None
+            user_keys = [game.user.urlsafe() for game in games]
+            tasks = [taskqueue.Task(url='/tasks/reminders/send', params={
+                         'user': user_keys[start:start + self.USERS_PER_TASK]})
+                     for start in range(0, len(user_keys),
+                                        self.USERS_PER_TASK)]
+            # Queue.add takes at most 100 tasks per call
+            for start in range(0, len(tasks), 100):
+                taskqueue.Queue(REMINDER_QUEUE).add(tasks[start:start + 100])
+            users += len(user_keys)
+            batches += len(tasks)
+        elapsed = time.time() - started
+        if more:
+            taskqueue.add(url='/tasks/reminders/fan_out',
+                          queue_name=REMINDER_QUEUE,
+                          params={'cursor': cursor.urlsafe(),
+                                  'started': started, 'users': users,
+                                  'batches': batches})
+            logging.info('Reminder fan-out checkpoint: %d users in %d batches '
+                         'after %.1fs', users, batches, elapsed)
+        else:
+            logging.info('Reminder fan-out done: %d users in %d batches in '
+                         '%.1fs (%.1f users/s)', users, batches, elapsed,
+                         users / max(elapsed, 0.001))
+        self.response.set_status(204)
+
+
+class SendReminderBatch(webapp2.RequestHandler):
+    @profiled('SendReminderBatch.post')
+    def post(self):
+        """Send a reminder email to each User of the batch that has an email
+        address. The Users are fetched with one get_multi."""
         app_id = app_identity.get_application_id()
-        games=Game.query(Game.game_over == False)
-        if games:
-            for game in games:
-                user_key=game.user
-                user=user_key.get()
-                user_name=user.name
-                user_email=user.email
-                if user_email:
-                    subject = 'This is a reminder!'
-                    body = 'Hello {}, Complete Your Game...!'.format(user_name)
-                    # This will send test emails, the arguments to send_mail
-                    #  are: from, to, subject, body
-                    mail.send_mail('noreply@{}.appspotmail.com'.format(app_id),
-                                   user_email,
-                                   subject,
-                                   body)
+        user_keys = [ndb.Key(urlsafe=urlsafe)
+                     for urlsafe in self.request.get_all('user')]
+        sent = 0
+        for user in ndb.get_multi(user_keys):
+            if user and user.email:
+                subject = 'This is a reminder!'
+                body = 'Hello {}, Complete Your Game...!'.format(user.name)
+                # This will send test emails, the arguments to send_mail
+                #  are: from, to, subject, body
+                mail.send_mail('noreply@{}.appspotmail.com'.format(app_id),
+                               user.email,
+                               subject,
+                               body)
+                sent += 1
+        logging.info('Sent %d of %d reminders', sent, len(user_keys))
+        self.response.set_status(204)
 
 
 class UpdateAverageMovesRemaining(webapp2.RequestHandler):
+    @profiled('UpdateAverageMovesRemaining.post')
     def post(self):
         """Update game listing announcement in memcache."""
-        HangmanApi._cache_average_attempts()
+        ActiveGames.cache_average()
+        self.response.set_status(204)
+
+
+class RebuildPerformance(webapp2.RequestHandler):
+    BATCH_SIZE = 100
+    PRUNE_BATCH_SIZE = 500
+
+    @profiled('RebuildPerformance.post')
+    def post(self):
+        """Recompute the Performance of one batch of Users from the Score
+        table, then chain the next batch. After the last User the prune
+        phase walks the Performance keys in batches and deletes the rows
+        not keyed by a User, which would otherwise be ranked twice. One-off
+        migration for games finished before ranking was incremental."""
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = ndb.Cursor(urlsafe=self.request.get('cursor'))
+        prune = self.request.get('phase') == 'prune'
+        if prune:
+            keys, next_cursor, more = Performance.query().fetch_page(
+                self.PRUNE_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+            Performance.prune(keys)
+        else:
+            users, next_cursor, more = User.query().fetch_page(
+                self.BATCH_SIZE, start_cursor=cursor)
+            Performance.rebuild(users)
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/rebuild_performance',
+                          params={'cursor': next_cursor.urlsafe(),
+                                  'phase': 'prune' if prune else 'rebuild'})
+        elif not prune:
+            taskqueue.add(url='/tasks/rebuild_performance',
+                          params={'phase': 'prune'})
+        self.response.set_status(204)
+
+
+class RebuildActiveGames(webapp2.RequestHandler):
+    BATCH_SIZE = 500
+
+    @profiled('RebuildActiveGames.post')
+    def post(self):
+        """Count one batch of active Games and chain the next batch with the
+        running totals; the last batch writes them to the counters. One-off
+        migration for games created before the counters were kept."""
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = ndb.Cursor(urlsafe=self.request.get('cursor'))
+        count = int(self.request.get('games', 0))
+        attempts = int(self.request.get('attempts', 0))
+        games, next_cursor, more = Game.query(
+            Game.game_over == False).fetch_page(self.BATCH_SIZE,
+                                                start_cursor=cursor)
+        count += len(games)
+        attempts += sum(game.attempts_remaining for game in games)
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/rebuild_active_games',
+                          params={'cursor': next_cursor.urlsafe(),
+                                  'games': count, 'attempts': attempts})
+        else:
+            ActiveGames.reset(count, attempts)
+            ActiveGames.cache_average()
+        self.response.set_status(204)
+
+
+class UpgradeGames(webapp2.RequestHandler):
+    BATCH_SIZE = 200
+
+    @profiled('UpgradeGames.post')
+    def post(self):
+        """Move one batch of Games stored with the legacy letters_guessed and
+        game_history lists to the compact encoding, then chain the next batch
+        through the task queue until the table is done."""
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = ndb.Cursor(urlsafe=self.request.get('cursor'))
+        games, next_cursor, more = Game.query().fetch_page(
+            self.BATCH_SIZE, start_cursor=cursor)
+        ndb.put_multi([game for game in games if game.upgrade()])
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/upgrade_games',
+                          params={'cursor': next_cursor.urlsafe()})
+        self.response.set_status(204)
+
+
+class UpgradeScores(webapp2.RequestHandler):
+    BATCH_SIZE = 500
+
+    @profiled('UpgradeScores.post')
+    def post(self):
+        """Re-put one batch of Scores so that ones stored before the sort_key
+        property existed are indexed for the high score board, then chain the
+        next batch."""
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = ndb.Cursor(urlsafe=self.request.get('cursor'))
+        scores, next_cursor, more = Score.query().fetch_page(
+            self.BATCH_SIZE, start_cursor=cursor)
+        ndb.put_multi(scores)
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/upgrade_scores',
+                          params={'cursor': next_cursor.urlsafe()})
+        self.response.set_status(204)
+
+
+class BackfillUserStats(webapp2.RequestHandler):
+    BATCH_SIZE = 500
+
+    @profiled('BackfillUserStats.post')
+    def post(self):
+        """Rebuild UserStats from the Score table, one batch of Scores per
+        task. Scores are read ordered by user and date, so each User's
+        Scores are contiguous: a User's stats are started afresh at their
+        first Score and carried over into the next batch when their Scores
+        span two. One-off job for games finished before UserStats existed.
+
+        It overwrites UserStats rather than merging, so run it before games
+        are played against the new code, else stats recorded meanwhile are
+        counted twice or lost. Score.date has no time of day, so games
+        finished on the same day are replayed in key order and the streaks
+        are only approximate."""
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = ndb.Cursor(urlsafe=self.request.get('cursor'))
+        last_user = None
+        if self.request.get('last_user'):
+            last_user = ndb.Key(urlsafe=self.request.get('last_user'))
+        scores, next_cursor, more = Score.query().order(
+            Score.user, Score.date).fetch_page(self.BATCH_SIZE,
+                                               start_cursor=cursor)
+        stats = {}
+        for score in scores:
+            if score.user not in stats:
+                key = UserStats.key_for(score.user)
+                if score.user == last_user:
+                    stats[score.user] = key.get() or UserStats(key=key)
+                else:
+                    stats[score.user] = UserStats(key=key)
+            stats[score.user].record(score)
+        ndb.put_multi(stats.values())
+        if more and next_cursor and scores:
+            taskqueue.add(url='/tasks/backfill_user_stats',
+                          params={'cursor': next_cursor.urlsafe(),
+                                  'last_user': scores[-1].user.urlsafe()})
         self.response.set_status(204)
 
 
+class ArchiveGames(webapp2.RequestHandler):
+    STALE_DAYS = 30
+    BATCH_SIZE = 200
+    TIME_BUDGET = 60
+
+    @profiled('ArchiveGames.get')
+    def get(self):
+        """Start archiving abandoned games. Called daily using a cron job."""
+        taskqueue.add(url='/tasks/archive_games')
+
+    @profiled('ArchiveGames.post')
+    def post(self):
+        """Move active Games with no move for STALE_DAYS days to ArchivedGame,
+        in keys-only batches, for up to TIME_BUDGET seconds. Chains itself
+        with the cursor it reached when there is more to do."""
+        deadline = time.time() + self.TIME_BUDGET
+        cutoff = datetime.now() - timedelta(days=self.STALE_DAYS)
+        cursor = None
+        if self.request.get('cursor'):
+            cursor = ndb.Cursor(urlsafe=self.request.get('cursor'))
+        query = Game.query(Game.game_over == False,
+                           Game.last_move_at < cutoff)
+        archived = 0
+        more = True
+        while more and time.time() < deadline:
+            keys, cursor, more = query.fetch_page(
+                self.BATCH_SIZE, start_cursor=cursor, keys_only=True)
+            more = more and cursor is not None
+            # The index may lag; recheck the Games themselves
+            games = [game for game in ndb.get_multi(keys)
+                     if game and not game.game_over and
+                     game.last_move_at < cutoff]
+            if games:
+                gamecache.forget_multi([game.key for game in games])
+                ArchivedGame.archive(games)
+                archived += len(games)
+        if more:
+            taskqueue.add(url='/tasks/archive_games',
+                          params={'cursor': cursor.urlsafe()})
+        logging.info('Archived %d abandoned games', archived)
+        self.response.set_status(204)
+
+
+class FlushGame(webapp2.RequestHandler):
+    @profiled('FlushGame.post')
+    def post(self):
+        """Write the unwritten moves of a cached game to the datastore.
+        Queued after the first move that was only cached."""
+        game_key = ndb.Key(urlsafe=self.request.get('game'))
+        if not gamecache.flush(game_key):
+            gamecache.schedule_flush(game_key)
+        self.response.set_status(204)
+
+
+class Warmup(webapp2.RequestHandler):
+    def get(self):
+        """Load the Endpoints API and the default dictionary before the
+        instance takes traffic. Called by App Engine on new instances."""
+        started = time.time()
+        import api
+        import dictionary
+        dictionary.get()
+        logging.info('Warmup loaded api in %.0fms',
+                     (time.time() - started) * 1000)
+        self.response.set_status(200)
+
+
+class ProfileReport(webapp2.RequestHandler):
+    def get(self):
+        """Return the sampled per-endpoint timings and RPC counts, and the
+        response cache hit counts, as JSON."""
+        stats = report()
+        stats['response_cache'] = rescache.stats()
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(stats, indent=2, sort_keys=True))
+
+
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', Warmup),
     ('/crons/send_reminder', SendReminderEmail),
+    ('/tasks/reminders/fan_out', ReminderFanOut),
+    ('/tasks/reminders/send', SendReminderBatch),
     ('/tasks/cache_average_attempts', UpdateAverageMovesRemaining),
+    ('/tasks/rebuild_performance', RebuildPerformance),
+    ('/tasks/upgrade_games', UpgradeGames),
+    ('/tasks/rebuild_active_games', RebuildActiveGames),
+    ('/tasks/upgrade_scores', UpgradeScores),
+    ('/tasks/flush_game', FlushGame),
+    ('/tasks/backfill_user_stats', BackfillUserStats),
+    ('/crons/archive_games', ArchiveGames),
+    ('/tasks/archive_games', ArchiveGames),
+    ('/admin/profile', ProfileReport),
 ], debug=True)
@@ -3,25 +3,114 @@ entities used by the Game. Because these classes are also regular Python
 classes they can include methods (such as 'to_form' and 'new_game')."""
 
 import random
-from datetime import date
+from datetime import date, datetime
 from protorpc import messages
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
+import dictionary
+import gamestate
+import rescache
+from lru import LRUCache
 
-#List of all words for puzzle. Random word gets selected from this list.
-words = ["udacity","education","simple","easy","navjot","university",
-         "goooooood","apartment","hyundai","mercedes","engine","nanodegree",
-         "fullstack" ]
+
+
+MEMCACHE_USER_KEY = 'USER_KEY:'
+USER_KEY_SECONDS = 600
+# user name -> User key, in front of memcache
+_user_keys = LRUCache(max_size=2000, ttl=USER_KEY_SECONDS)
+
+
+def iter_batches(query, batch_size=500, start_cursor=None):
+    """Yields (entities, cursor) for each batch of at most batch_size results
+    of query, following query cursors so that only one batch is held in
+    memory at a time. cursor is where the next batch starts, None after the
+    last batch, which is yielded even if it is empty. Meant for offline jobs
+    and exports."""
+    cursor = start_cursor
+    while True:
+        entities, cursor, more = query.fetch_page(batch_size,
+                                                  start_cursor=cursor)
+        more = more and cursor is not None
+        yield entities, cursor if more else None
+        if not more:
+            return
 
 
 class User(ndb.Model):
-    """User profile"""
+    """User profile. Users are keyed by name; ones created before that keep
+    their numeric ids and are found through the name index."""
     name = ndb.StringProperty(required=True)
     email =ndb.StringProperty()
 
-    def add_performance(self, perform):
-        perform = Performance(user=self.name, performance=perform)
-        perform.put()
-        perform.put()
+    @classmethod
+    def get_by_name(cls, name):
+        """Returns the User called name or None. The name -> key mapping is
+        read through an in-process LRU and memcache, and the entity itself
+        comes from ndb's cache, so a warm lookup makes no datastore RPC."""
+        return cls.get_by_name_async(name).get_result()
+
+    @classmethod
+    @ndb.tasklet
+    def get_by_name_async(cls, name):
+        "Tasklet version of get_by_name, returns a Future for the User"
+        if not name:
+            raise ndb.Return(None)
+        context = ndb.get_context()
+        key = _user_keys.get(name)
+        if key is None:
+            urlsafe = yield context.memcache_get(MEMCACHE_USER_KEY + name)
+            if urlsafe:
+                key = ndb.Key(urlsafe=urlsafe)
+        if key is not None:
+            user = yield key.get_async()
+            if user:
+                _user_keys.set(name, key)
+                raise ndb.Return(user)
+            cls.forget_name(name)
+        user = yield ndb.Key(cls, name).get_async()
+        if not user:
+            user = yield cls.query(cls.name == name).get_async()
+        if user:
+            _user_keys.set(name, user.key)
+            yield context.memcache_set(MEMCACHE_USER_KEY + name,
+                                       user.key.urlsafe(),
+                                       time=USER_KEY_SECONDS)
+        raise ndb.Return(user)
+
+    @classmethod
+    def forget_name(cls, name):
+        "Drops name from the lookup caches"
+        _user_keys.delete(name)
+        memcache.delete(MEMCACHE_USER_KEY + name)
+
+    @classmethod
+    def create(cls, name, email=None):
+        """Creates a User keyed by name along with its Performance, in one
+        transaction. Returns None if the name is taken."""
+        if cls.query(cls.name == name).get(keys_only=True):
+            # Taken by a User created before Users were keyed by name
+            return None
+
+        @ndb.transactional(xg=True)
+        def _create():
+            key = ndb.Key(cls, name)
+            if key.get():
+                return None
+            user = cls(key=key, name=name, email=email)
+            ndb.put_multi([user, Performance(key=Performance.key_for(key),
+                                             user=name, performance=0.0)])
+            return user
+        user = _create()
+        cls.forget_name(name)
+        return user
+
+    @classmethod
+    def names_for(cls, user_keys):
+        """Returns a dict of User key -> name for user_keys, resolving every
+        distinct key with a single get_multi"""
+        keys = list(set(user_keys))
+        return dict((key, user.name)
+                    for key, user in zip(keys, ndb.get_multi(keys)) if user)
 
 
 class Game(ndb.Model):
@@ -31,45 +120,127 @@ class Game(ndb.Model):
     attempts_remaining = ndb.IntegerProperty(required=True, default=5)
     game_over = ndb.BooleanProperty(required=True, default=False)
     user = ndb.KeyProperty(required=True, kind='User')
+    # Compact state, see gamestate.py
+    guessed_mask = ndb.IntegerProperty(default=0, indexed=False)
+    moves = ndb.BlobProperty(default='')
+    # Legacy state, only read to upgrade Games stored before the compact
+    # encoding. Empty repeated properties are not written back.
     letters_guessed=ndb.StringProperty(repeated=True)
     game_history=ndb.StringProperty(repeated=True)
+    # When the game was created or last guessed in; stale games are archived
+    last_move_at = ndb.DateTimeProperty()
+    # The dictionary the target came from, None for the built in list
+    dictionary_name = ndb.StringProperty(indexed=False)
+
+    @classmethod
+    def new_game(cls, user, attempts, words=None, length=None,
+                 difficulty=None):
+        """Creates and returns a new game. The target is a random word from
+        the named dictionary (the built in list by default), optionally of
+        the given length and difficulty. Raises dictionary.NoMatchingWord if
+        no word fits."""
+        return cls.new_game_async(user, attempts, words, length,
+                                  difficulty).get_result()
 
     @classmethod
-    def new_game(cls, user, attempts):
-        """Creates and returns a new game"""
+    @ndb.tasklet
+    def new_game_async(cls, user, attempts, words=None, length=None,
+                       difficulty=None):
+        """Tasklet version of new_game. The Game and the ActiveGames counter
+        are written concurrently."""
+        target = dictionary.get(words).choice(length, difficulty)
         game = Game(user=user,
-                    target=random.choice(words).lower(),
+                    target=target.lower(),
                     attempts_allowed=attempts,
                     attempts_remaining=attempts,
-                    game_over=False)
-        game.put()
-        return game
-
-    def to_form(self, message):
-        """Returns a GameForm representation of the Game"""
+                    game_over=False,
+                    last_move_at=datetime.now(),
+                    dictionary_name=words)
+        yield game.put_async(), ActiveGames.add_async(games=1,
+                                                      attempts=attempts)
+        raise ndb.Return(game)
+
+    def upgrade(self):
+        """Moves legacy letters_guessed/game_history lists into the compact
+        state, and starts the archival clock of Games stored before
+        last_move_at. Returns True if the Game changed and needs a put()."""
+        changed = False
+        if self.last_move_at is None:
+            self.last_move_at = datetime.now()
+            changed = True
+        if not self.letters_guessed:
+            return changed
+        mask = self.guessed_mask or 0
+        moves = []
+        for letter in self.letters_guessed:
+            if gamestate.is_letter(letter) and \
+                    not mask & gamestate.letter_bit(letter):
+                mask |= gamestate.letter_bit(letter)
+                moves.append(gamestate.encode_move(letter,
+                                                   letter in self.target))
+        self.guessed_mask = mask
+        self.moves = (self.moves or '') + ''.join(moves)
+        self.letters_guessed = []
+        self.game_history = []
+        return True
+
+    def has_guessed(self, letter):
+        "Returns True if letter was already guessed in this Game"
+        self.upgrade()
+        return bool(self.guessed_mask & gamestate.letter_bit(letter))
+
+    def guess(self, letter):
+        """Records a guess of a lower case letter and returns True if it is
+        in the target word. Does not touch attempts or game_over."""
+        self.upgrade()
+        correct = letter in self.target
+        self.last_move_at = datetime.now()
+        self.guessed_mask |= gamestate.letter_bit(letter)
+        self.moves = (self.moves or '') + \
+            gamestate.encode_move(letter, correct)
+        return correct
+
+    def is_solved(self):
+        "Returns True if every letter of the target has been guessed"
+        target_mask = gamestate.word_mask(self.target)
+        return self.guessed_mask & target_mask == target_mask
+
+    def masked_word(self):
+        "Returns the target with unguessed letters hidden"
+        return gamestate.mask_word(self.target, self.guessed_mask)
+
+    def history(self):
+        "Returns the move log as GameHistory text lines"
+        self.upgrade()
+        return [gamestate.history_line(letter, correct)
+                for letter, correct in gamestate.decode_moves(self.moves)]
+
+    def to_form(self, message, user_name=None):
+        """Returns a GameForm representation of the Game. Pass user_name when
+        it is already known to save fetching the User."""
         form = GameForm()
         form.urlsafe_key = self.key.urlsafe()
-        form.user_name = self.user.get().name
+        form.user_name = user_name or self.user.get().name
         form.attempts_remaining = self.attempts_remaining
         form.game_over = self.game_over
         form.message = message
         return form
 
-    def to_form_game(self):
+    def to_form_game(self, user_name=None):
         "Return the GameHistory representation of game"
         form=GameHistory()
-        form.user=self.user.get().name
+        form.user=user_name or self.user.get().name
         form.game_over=self.game_over
-        form.game_history=self.game_history
+        form.game_history=self.history()
         #form.target_word=self.target
 
         return form
 
-    def end_game(self, won=False):
-        """Ends the game - if won is True, the player won. - if won is False,
-        the player lost."""
+    def finish(self, won=False):
+        """Marks the game over and returns the unsaved Score, and updated
+        Performance and UserStats, it produces. Call inside a transaction and
+        put them together with the Game."""
         self.game_over = True
-        self.put()
         performance= \
             (self.attempts_remaining / float(self.attempts_allowed))*100
 
@@ -77,12 +248,247 @@ class Game(ndb.Model):
         score = Score(user=self.user, date=date.today(), won=won,
                       guesses=self.attempts_allowed - self.attempts_remaining,
                       performance=performance)
-        score.put()
+        perform = Performance.get_or_new(self.user)
+        if won:
+            perform.performance += performance
+        stats = UserStats.get_or_new(self.user)
+        stats.record(score)
+        def committed():
+            Score.offer(score)
+            rescache.bump(rescache.SCORES)
+        # Runs at once outside a transaction, else after it commits
+        ndb.get_context().call_on_commit(committed)
+        return [score, perform, stats]
+
+
+class ArchivedGame(ndb.Model):
+    """A Game abandoned for longer than the archival limit, moved out of the
+    Game table so that queries over active games stay small. Keeps the id of
+    the Game it replaces."""
+    user = ndb.KeyProperty(required=True, kind='User')
+    target = ndb.StringProperty(required=True, indexed=False)
+    attempts_allowed = ndb.IntegerProperty(required=True, indexed=False)
+    attempts_remaining = ndb.IntegerProperty(required=True, indexed=False)
+    guessed_mask = ndb.IntegerProperty(default=0, indexed=False)
+    moves = ndb.BlobProperty(default='')
+    last_move_at = ndb.DateTimeProperty(indexed=False)
+    archived_at = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+    @classmethod
+    def archive(cls, games):
+        """Replaces games with ArchivedGames and takes them off the
+        ActiveGames counters. Call with Games known to be active."""
+        archived = []
+        for game in games:
+            game.upgrade()
+            archived.append(cls(id=game.key.id(), user=game.user,
+                                target=game.target,
+                                attempts_allowed=game.attempts_allowed,
+                                attempts_remaining=game.attempts_remaining,
+                                guessed_mask=game.guessed_mask,
+                                moves=game.moves,
+                                last_move_at=game.last_move_at))
+        ndb.put_multi(archived)
+        ndb.delete_multi([game.key for game in games])
+        rescache.bump(*[rescache.game_scope(game.key) for game in games])
+        ActiveGames.add(games=-len(games),
+                        attempts=-sum(game.attempts_remaining
+                                      for game in games))
+
+
+MEMCACHE_MOVES_REMAINING = 'MOVES_REMAINING'
+# The average is recomputed from the counter shards at most this often
+MOVES_REMAINING_SECONDS = 30
+
+
+class ActiveGames(ndb.Model):
+    """One shard of the running number of active Games and the sum of their
+    attempts remaining. Updates go to a random one of NUM_SHARDS entities so
+    that busy games do not contend on a single entity group; reading the
+    totals is a get_multi of the fixed set of shard keys."""
+    NUM_SHARDS = 20
+    games = ndb.IntegerProperty(default=0, indexed=False)
+    attempts = ndb.IntegerProperty(default=0, indexed=False)
+
+    @classmethod
+    def shard_keys(cls):
+        "Returns the keys of every shard"
+        return [ndb.Key(cls, 'shard-{}'.format(index))
+                for index in range(cls.NUM_SHARDS)]
+
+    @classmethod
+    def add(cls, games=0, attempts=0):
+        "Adds to the active game count and attempts remaining sum"
+        cls.add_async(games, attempts).get_result()
+
+    @classmethod
+    def add_async(cls, games=0, attempts=0):
+        "Async version of add, returns a Future"
+        if not games and not attempts:
+            future = ndb.Future()
+            future.set_result(None)
+            return future
+        return cls._add_async(random.choice(cls.shard_keys()), games,
+                              attempts)
+
+    @staticmethod
+    @ndb.transactional_tasklet
+    def _add_async(key, games, attempts):
+        shard = yield key.get_async()
+        shard = shard or ActiveGames(key=key)
+        shard.games += games
+        shard.attempts += attempts
+        yield shard.put_async()
+
+    @classmethod
+    def totals(cls):
+        "Returns the (active game count, attempts remaining sum)"
+        shards = [shard for shard in ndb.get_multi(cls.shard_keys()) if shard]
+        return (sum(shard.games for shard in shards),
+                sum(shard.attempts for shard in shards))
+
+    @classmethod
+    def cache_average(cls):
+        """Populates memcache with the average moves remaining of Games from
+        the counters and returns the message"""
+        count, total_attempts_remaining = cls.totals()
+        message = ''
+        if count > 0:
+            average = float(total_attempts_remaining)/count
+            message = 'The average moves remaining is {:.2f}'.format(average)
+        memcache.set(MEMCACHE_MOVES_REMAINING, message,
+                     time=MOVES_REMAINING_SECONDS)
+        return message
+
+    @classmethod
+    def reset(cls, games, attempts):
+        """Sets the totals to games and attempts, clearing every shard. Used
+        by the counter rebuild once it has counted the active Games."""
+        shards = [cls(key=key) for key in cls.shard_keys()]
+        shards[0].games = games
+        shards[0].attempts = attempts
+        ndb.put_multi(shards)
+
+
+class UserStats(ndb.Model):
+    """Running totals of one User's finished games, keyed by the User's key
+    id. Updated in the transaction that ends each game, so a profile summary
+    is one read rather than a scan of the User's Scores."""
+    games_played = ndb.IntegerProperty(default=0, indexed=False)
+    wins = ndb.IntegerProperty(default=0, indexed=False)
+    total_performance = ndb.FloatProperty(default=0.0, indexed=False)
+    best_won = ndb.BooleanProperty(indexed=False)
+    best_performance = ndb.FloatProperty(indexed=False)
+    best_guesses = ndb.IntegerProperty(indexed=False)
+    best_date = ndb.DateProperty(indexed=False)
+    current_streak = ndb.IntegerProperty(default=0, indexed=False)
+    longest_streak = ndb.IntegerProperty(default=0, indexed=False)
+
+    @classmethod
+    def key_for(cls, user_key):
+        "Returns the key of the UserStats entity of a User"
+        return ndb.Key(cls, user_key.id())
+
+    @classmethod
+    def get_or_new(cls, user_key):
+        "Returns the User's UserStats, or a new unsaved empty one"
+        return cls.key_for(user_key).get() or cls(key=cls.key_for(user_key))
+
+    def record(self, score):
+        "Adds a finished game's Score to the totals"
+        self.games_played += 1
+        self.total_performance += score.performance
+        if score.won:
+            self.wins += 1
+            self.current_streak += 1
+            self.longest_streak = max(self.longest_streak,
+                                      self.current_streak)
+        else:
+            self.current_streak = 0
+        # Best in high score order: a win, then fewer guesses, then
+        # higher performance
+        if self.best_guesses is None or \
+                (score.won, -score.guesses, score.performance) > \
+                (self.best_won, -self.best_guesses, self.best_performance):
+            self.best_won = score.won
+            self.best_performance = score.performance
+            self.best_guesses = score.guesses
+            self.best_date = score.date
+
+    def to_form(self, user_name):
+        "Returns the UserStatsForm representation of UserStats"
+        average = 0.0
+        if self.games_played:
+            average = self.total_performance / self.games_played
+        return UserStatsForm(user_name=user_name,
+                             games_played=self.games_played,
+                             wins=self.wins,
+                             total_performance=self.total_performance,
+                             average_performance=average,
+                             best_performance=self.best_performance,
+                             best_guesses=self.best_guesses,
+                             best_date=self.best_date and str(self.best_date),
+                             current_streak=self.current_streak,
+                             longest_streak=self.longest_streak)
+
+
+class UserStatsForm(messages.Message):
+    """UserStatsForm for outbound summary of a User's games"""
+    user_name = messages.StringField(1, required=True)
+    games_played = messages.IntegerField(2, required=True)
+    wins = messages.IntegerField(3, required=True)
+    total_performance = messages.FloatField(4, required=True)
+    average_performance = messages.FloatField(5, required=True)
+    best_performance = messages.FloatField(6)
+    best_guesses = messages.IntegerField(7)
+    best_date = messages.StringField(8)
+    current_streak = messages.IntegerField(9, required=True)
+    longest_streak = messages.IntegerField(10, required=True)
+
 
 class Performance(ndb.Model):
-    """Performance object"""
+    """Performance object. One per User, keyed by the User's key id and kept
+    up to date by Game.finish as games end, so ranking is a plain sorted
+    read."""
     user = ndb.StringProperty(required=True)
-    performance=ndb.FloatProperty(required=True)
+    performance=ndb.FloatProperty(required=True, default=0.0)
+
+    @classmethod
+    def key_for(cls, user_key):
+        "Returns the key of the Performance entity of a User"
+        return ndb.Key(cls, user_key.id())
+
+    @classmethod
+    def get_or_new(cls, user_key):
+        "Returns the User's Performance, or a new unsaved one at zero"
+        perform = cls.key_for(user_key).get()
+        if not perform:
+            perform = cls(key=cls.key_for(user_key),
+                          user=user_key.get().name, performance=0.0)
+        return perform
+
+    @classmethod
+    def rebuild(cls, users):
+        """Recomputes the Performance of users from their won Scores, read
+        with one query per User run concurrently. Only needed once for data
+        created before Performance was maintained incrementally."""
+        wins = [Score.query(Score.user == user.key,
+                            Score.won == True).fetch_async()
+                for user in users]
+        ndb.put_multi([
+            cls(key=cls.key_for(user.key), user=user.name,
+                performance=sum(score.performance
+                                for score in won.get_result()))
+            for user, won in zip(users, wins)])
+
+    @classmethod
+    def prune(cls, keys):
+        """Deletes the Performances among keys that are not keyed by a
+        User, as the ones saved with allocated ids before Performance was
+        kept per User are."""
+        users = ndb.get_multi([ndb.Key(User, key.id()) for key in keys])
+        ndb.delete_multi([key for key, user in zip(keys, users)
+                          if user is None])
 
     def to_form(self,rank):
         "Returns the PerformanceForm representatioon of Score"
@@ -99,7 +505,27 @@ class PerformanceForm(messages.Message):
 class PerformanceForms(messages.Message):
     "Return multiple PerformanceForm"
     ranks=messages.MessageField(PerformanceForm,1,repeated=True)
+    next_cursor = messages.StringField(2)
+
+
 
+MEMCACHE_HIGH_SCORES = 'HIGH_SCORES'
+HIGH_SCORES_SIZE = 100
+# The board is rebuilt from an eventually consistent query, which can miss
+# the Score that invalidated it; expiring it bounds how long that lasts
+HIGH_SCORES_SECONDS = 60
+_GUESSES_LIMIT = (1 << 20) - 1
+
+
+def _score_sort_key(score):
+    """Packs the high score order - won first, then fewer guesses, then
+    higher performance - into one integer so a single property index serves
+    the high score board"""
+    guesses = min(max(score.guesses, 0), _GUESSES_LIMIT)
+    performance = min(max(int(round(score.performance * 100)), 0),
+                      _GUESSES_LIMIT)
+    return (int(bool(score.won)) << 40) | \
+        ((_GUESSES_LIMIT - guesses) << 20) | performance
 
 
 class Score(ndb.Model):
@@ -109,13 +535,45 @@ class Score(ndb.Model):
     won = ndb.BooleanProperty(required=True)
     guesses = ndb.IntegerProperty(required=True)
     performance=ndb.FloatProperty(required=True)
+    sort_key = ndb.ComputedProperty(_score_sort_key)
+
+    @classmethod
+    def top(cls):
+        """Returns the best HIGH_SCORES_SIZE Scores, best first, as (Score,
+        urlsafe cursor after it) pairs so a page of the board can be
+        continued from the index. Kept in memcache until a new Score good
+        enough to enter it is written, or for HIGH_SCORES_SECONDS."""
+        board = memcache.get(MEMCACHE_HIGH_SCORES)
+        if board is None:
+            scores = cls.query().order(-cls.sort_key).iter(
+                limit=HIGH_SCORES_SIZE, produce_cursors=True)
+            board = [(score, scores.cursor_after().urlsafe())
+                     for score in scores]
+            memcache.set(MEMCACHE_HIGH_SCORES, board,
+                         time=HIGH_SCORES_SECONDS)
+        return board
 
-    def to_form(self):
+    @classmethod
+    def offer(cls, score):
+        "Drops the cached top Scores if score belongs among them"
+        board = memcache.get(MEMCACHE_HIGH_SCORES)
+        if board is not None and (len(board) < HIGH_SCORES_SIZE or
+                                  score.sort_key > board[-1][0].sort_key):
+            memcache.delete(MEMCACHE_HIGH_SCORES)
+
+    def to_form(self, user_name=None):
         "Returns the ScoreForm representatioon of Score"
-        return ScoreForm(user_name=self.user.get().name, won=self.won,
+        return ScoreForm(user_name=user_name or self.user.get().name,
+                         won=self.won,
                          date=str(self.date), guesses=self.guesses,
                          performance=self.performance)
 
+    @classmethod
+    def to_forms(cls, scores):
+        "Returns ScoreForms for scores, fetching their Users in one batch"
+        names = User.names_for([score.user for score in scores])
+        return [score.to_form(names.get(score.user)) for score in scores]
+
 
 
 class GameForm(messages.Message):
@@ -125,10 +583,13 @@ class GameForm(messages.Message):
     game_over = messages.BooleanField(3, required=True)
     message = messages.StringField(4, required=True)
     user_name = messages.StringField(5, required=True)
+    etag = messages.StringField(6)
+    not_modified = messages.BooleanField(7)
 
 class GamesForm(messages.Message):
     "Return multiple GameForm"
     mess= messages.MessageField(GameForm,1,repeated=True)
+    next_cursor = messages.StringField(2)
 
 class GameHistory(messages.Message):
     "GameHistory for outbound game history information"
@@ -136,6 +597,8 @@ class GameHistory(messages.Message):
     game_over=messages.BooleanField(2,required=True)
     game_history = messages.StringField(3, repeated=True)
     #target_word= messages.StringField(4,required=True)
+    etag = messages.StringField(5)
+    not_modified = messages.BooleanField(6)
 
 
 class GamesHistory(messages.Message):
@@ -147,6 +610,16 @@ class NewGameForm(messages.Message):
     """Used to create a new game"""
     user_name = messages.StringField(1, required=True)
     attempts=messages.IntegerField(2,required=True)
+    dictionary = messages.StringField(3)
+    word_length = messages.IntegerField(4)
+    difficulty = messages.StringField(5)
+
+
+class HintForm(messages.Message):
+    """HintForm for outbound suggested next guess"""
+    letter = messages.StringField(1)
+    candidates = messages.IntegerField(2, required=True)
+    message = messages.StringField(3, required=True)
 
 
 class MakeMoveForm(messages.Message):
@@ -154,6 +627,24 @@ class MakeMoveForm(messages.Message):
     guess = messages.StringField(1, required=True)
 
 
+class MakeMovesForm(messages.Message):
+    """Used to make several moves, in order, in an existing game"""
+    guesses = messages.StringField(1, repeated=True)
+
+
+class MoveResultForm(messages.Message):
+    """Outcome of one guess of a make_moves call"""
+    guess = messages.StringField(1, required=True)
+    applied = messages.BooleanField(2, required=True)
+    message = messages.StringField(3, required=True)
+
+
+class MovesForm(messages.Message):
+    """Per guess results and final game state of a make_moves call"""
+    results = messages.MessageField(MoveResultForm, 1, repeated=True)
+    game = messages.MessageField(GameForm, 2, required=True)
+
+
 class ScoreForm(messages.Message):
     """ScoreForm for outbound Score information"""
     user_name = messages.StringField(1, required=True)
@@ -165,6 +656,9 @@ class ScoreForm(messages.Message):
 class ScoreForms(messages.Message):
     """Return multiple ScoreForms"""
     items = messages.MessageField(ScoreForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    etag = messages.StringField(3)
+    not_modified = messages.BooleanField(4)
 
 class StringMessage(messages.Message):
     """StringMessage-- outbound (single) string message"""
@@ -0,0 +1,153 @@
+"""profiling.py - Sampled timing and RPC accounting for API methods and task
+handlers.
+
+Decorate a function with @profiled('name'). A SAMPLE_RATE fraction of calls
+record their wall time, datastore gets, puts and queries, entity bytes
+written and memcache lookups and hits. Each sample is logged as one JSON
+line and added to per-name counters and a wall time histogram, which are
+flushed to memcache at most every FLUSH_SECONDS so that report() sees every
+instance. Unsampled calls cost one random() call."""
+
+import functools
+import json
+import logging
+import random
+import threading
+import time
+from google.appengine.api import apiproxy_stub_map, memcache
+
+SAMPLE_RATE = 0.05
+FLUSH_SECONDS = 30
+MEMCACHE_PREFIX = 'PROFILE:'
+# Upper bounds, in milliseconds, of the wall time histogram buckets
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+COUNTERS = ('calls', 'wall_ms', 'get', 'put', 'query', 'entity_bytes',
+            'memcache_get', 'memcache_hit')
+
+_local = threading.local()
+_lock = threading.Lock()
+_pending = {}
+_last_flush = [time.time()]
+# Every profiled name, so report() knows which counters to read
+_names = set()
+
+
+def _pre_call(service, call, request, response):
+    sample = getattr(_local, 'sample', None)
+    if sample is None or service != 'datastore_v3':
+        return
+    if call == 'Get':
+        sample['get'] += 1
+    elif call == 'Put':
+        sample['put'] += 1
+        sample['entity_bytes'] += sum(entity.ByteSize()
+                                      for entity in request.entity_list())
+    elif call == 'RunQuery':
+        sample['query'] += 1
+
+
+def _post_call(service, call, request, response):
+    sample = getattr(_local, 'sample', None)
+    if sample is None or service != 'memcache' or call != 'Get':
+        return
+    sample['memcache_get'] += request.key_size()
+    sample['memcache_hit'] += response.item_size()
+
+
+def _install_hooks():
+    """Hooks the RPC counters into the current API proxy. Appending under a
+    key that is already present is a no-op, and checking each sample covers
+    a proxy replaced after import, as the testbed does."""
+    proxy = apiproxy_stub_map.apiproxy
+    proxy.GetPreCallHooks().Append('profiling', _pre_call)
+    proxy.GetPostCallHooks().Append('profiling', _post_call)
+
+
+def _bucket(wall_ms):
+    for limit in BUCKETS_MS:
+        if wall_ms <= limit:
+            return 'le_{}'.format(limit)
+    return 'gt_{}'.format(BUCKETS_MS[-1])
+
+
+def _record(name, sample):
+    logging.info('profile %s', json.dumps(dict(sample, name=name)))
+    prefix = MEMCACHE_PREFIX + name + ':'
+    with _lock:
+        for counter, value in sample.iteritems():
+            key = prefix + counter
+            _pending[key] = _pending.get(key, 0) + int(round(value))
+        key = prefix + _bucket(sample['wall_ms'])
+        _pending[key] = _pending.get(key, 0) + 1
+        if time.time() - _last_flush[0] < FLUSH_SECONDS:
+            return
+        deltas = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = time.time()
+    memcache.offset_multi(deltas, initial_value=0)
+
+
+class recording(object):
+    """Context manager counting the RPCs made in its block on this thread.
+    Entering gives the counters dict, whose wall_ms is filled in on exit.
+    Blocks nested inside another recording are counted by the outer one."""
+
+    def __enter__(self):
+        _install_hooks()
+        self.sample = dict.fromkeys(COUNTERS, 0)
+        self.sample['calls'] = 1
+        self.outer = getattr(_local, 'sample', None)
+        _local.sample = self.outer if self.outer is not None else self.sample
+        self.start = time.time()
+        return self.sample
+
+    def __exit__(self, *exc_info):
+        self.sample['wall_ms'] = (time.time() - self.start) * 1000
+        _local.sample = self.outer
+        return False
+
+
+def profiled(name):
+    "Decorator recording a sample of calls to the wrapped function as name"
+    _names.add(name)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, 'sample', None) is not None or \
+                    random.random() >= SAMPLE_RATE:
+                return func(*args, **kwargs)
+            try:
+                with recording() as sample:
+                    return func(*args, **kwargs)
+            finally:
+                _record(name, sample)
+        return wrapper
+    return decorator
+
+
+def report():
+    """Returns {name: stats} for every profiled name with samples. Counters
+    are totals over all samples; histogram maps bucket to sample count."""
+    buckets = ['le_{}'.format(limit) for limit in BUCKETS_MS] + \
+        ['gt_{}'.format(BUCKETS_MS[-1])]
+    keys = [MEMCACHE_PREFIX + name + ':' + field
+            for name in _names for field in COUNTERS + tuple(buckets)]
+    values = memcache.get_multi(keys)
+    stats = {}
+    for name in sorted(_names):
+        prefix = MEMCACHE_PREFIX + name + ':'
+        calls = values.get(prefix + 'calls')
+        if not calls:
+            continue
+        entry = dict((counter, values.get(prefix + counter, 0))
+                     for counter in COUNTERS)
+        entry['sample_rate'] = SAMPLE_RATE
+        entry['mean_wall_ms'] = float(entry['wall_ms']) / calls
+        if entry['memcache_get']:
+            entry['memcache_hit_ratio'] = \
+                float(entry['memcache_hit']) / entry['memcache_get']
+        entry['histogram'] = dict((bucket, values.get(prefix + bucket, 0))
+                                  for bucket in buckets)
+        stats[name] = entry
+    return stats
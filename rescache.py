@@ -0,0 +1,127 @@
+"""rescache.py - Versioned cache of read-only API responses.
+
+Each cached response belongs to a scope - one game, or the score table -
+whose version number lives in memcache and is bumped whenever something in
+the scope changes. A response is cached under its endpoint, arguments and
+the current version of its scope, so a bump makes old entries unreachable
+without deleting them. The same triple gives the response's ETag. A request
+whose If-None-Match still matches gets the cached response flagged
+not_modified; Endpoints only passes a few error statuses through, so a 304
+can not be sent.
+
+Versions start from the current time in milliseconds rather than zero, so a
+version evicted from memcache restarts above any value it had before."""
+
+import hashlib
+import threading
+import time
+from google.appengine.api import memcache
+from protorpc import protojson
+
+from lru import LRUCache
+
+MEMCACHE_VERSION = 'VERSION:'
+MEMCACHE_RESPONSE = 'RESPONSE:'
+MEMCACHE_STATS = 'RESPONSE_STATS:'
+RESPONSE_SECONDS = 600
+# Responses larger than this are built every time
+MAX_RESPONSE_BYTES = 100000
+# Total size of the responses held in each instance
+INSTANCE_CACHE_BYTES = 4 * 1024 * 1024
+STATS_FLUSH_EVERY = 100
+SCORES = 'scores'
+
+_responses = LRUCache(max_size=500, ttl=60, max_bytes=INSTANCE_CACHE_BYTES)
+_stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+_stats_lock = threading.Lock()
+
+
+def game_scope(game_key):
+    "Returns the scope of one game's responses"
+    return 'game:' + game_key.urlsafe()
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def version(scope):
+    "Returns the current version of scope"
+    key = MEMCACHE_VERSION + scope
+    current = memcache.get(key)
+    if current is None:
+        memcache.add(key, _now_ms())
+        current = memcache.get(key) or 0
+    return current
+
+
+def bump(*scopes):
+    "Moves each scope to a new version, invalidating its cached responses"
+    if scopes:
+        memcache.offset_multi(dict((MEMCACHE_VERSION + scope, 1)
+                                   for scope in scopes),
+                              initial_value=_now_ms())
+
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+        if sum(_stats.values()) < STATS_FLUSH_EVERY:
+            return
+        deltas = dict((MEMCACHE_STATS + name, count)
+                      for name, count in _stats.iteritems() if count)
+        for name in _stats:
+            _stats[name] = 0
+    memcache.offset_multi(deltas, initial_value=0)
+
+
+def stats():
+    "Returns the hit, miss and not modified counts across instances"
+    values = memcache.get_multi([MEMCACHE_STATS + name for name in _stats])
+    counts = dict((name, values.get(MEMCACHE_STATS + name, 0))
+                  for name in _stats)
+    lookups = sum(counts.values())
+    if lookups:
+        counts['hit_ratio'] = \
+            float(counts['hits'] + counts['not_modified']) / lookups
+    return counts
+
+
+def etag_matches(etag, if_none_match):
+    "Returns True if an If-None-Match header value names etag"
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def respond(endpoint, args, scope, message_type, build, if_none_match=None,
+            seconds=RESPONSE_SECONDS):
+    """Returns the response of a read-only endpoint from the cache, or made
+    with build() and cached for seconds. Its etag field is set, and its
+    not_modified field is True if if_none_match names the etag."""
+    etag = hashlib.sha1(repr((endpoint, args, version(scope)))).hexdigest()
+    not_modified = etag_matches(etag, if_none_match)
+    key = MEMCACHE_RESPONSE + etag
+    encoded = _responses.get(key)
+    if encoded is None:
+        encoded = memcache.get(key)
+    if encoded is not None:
+        _count('not_modified' if not_modified else 'hits')
+        _responses.set(key, encoded)
+        message = protojson.decode_message(message_type, encoded)
+    else:
+        _count('misses')
+        message = build()
+        message.etag = etag
+        encoded = protojson.encode_message(message)
+        if len(encoded) <= MAX_RESPONSE_BYTES:
+            memcache.set(key, encoded, time=seconds)
+            _responses.set(key, encoded)
+    message.not_modified = not_modified
+    return message
@@ -0,0 +1,118 @@
+"""solver.py - Suggests the next letter to guess in a game.
+
+For each dictionary and word length an index holds, for every (position,
+letter), a bitset - a Python int with bit i set when word i has that letter
+there. The words that fit a masked pattern and set of guessed letters are
+then an AND of one bitset per position, and the number of remaining words
+containing each letter is one AND and popcount per letter, so a hint never
+scans the word list. Indexes are built once per instance on first use and
+hints are cached per (dictionary, pattern, guessed letters)."""
+
+import binascii
+import threading
+
+import dictionary
+import gamestate
+from lru import LRUCache
+
+# Fallback order when no dictionary word fits the game
+ENGLISH_ORDER = 'etaoinshrdlcumwfgypbvkjxqz'
+
+_indexes = {}
+_lock = threading.Lock()
+_hints = LRUCache(max_size=10000, ttl=3600)
+
+
+def _to_bitset(indexes, size):
+    "Returns the int with the bits at indexes set"
+    bits = bytearray((size + 7) // 8)
+    for index in indexes:
+        bits[index >> 3] |= 1 << (index & 7)
+    # Reverse to big endian so that bit i of the int is word i
+    return int(binascii.hexlify(bytes(bits[::-1])) or '0', 16)
+
+
+def popcount(bitset):
+    "Returns the number of set bits"
+    return bin(bitset).count('1')
+
+
+class LengthIndex(object):
+    "Bitsets over the words of one length of a dictionary"
+
+    def __init__(self, words):
+        self.size = len(words)
+        self.all = (1 << self.size) - 1
+        length = len(words[0]) if words else 0
+        positions = [dict() for _ in range(length)]
+        for index, word in enumerate(words):
+            for position, letter in enumerate(word):
+                positions[position].setdefault(letter, []).append(index)
+        # positions[i][letter] -> words with letter at position i
+        self.positions = [
+            dict((letter, _to_bitset(indexes, self.size))
+                 for letter, indexes in at.iteritems())
+            for at in positions]
+        # contains[letter] -> words with letter anywhere
+        self.contains = {}
+        for at in self.positions:
+            for letter, bitset in at.iteritems():
+                self.contains[letter] = self.contains.get(letter, 0) | bitset
+
+    def candidates(self, pattern, guessed):
+        """Returns the bitset of words matching pattern, where MASK_CHAR is an
+        unrevealed letter, given the letters guessed so far. An unrevealed
+        position can not hold a guessed letter, which also rules out every
+        word containing a wrong guess."""
+        matches = self.all
+        for position, shown in enumerate(pattern):
+            at = self.positions[position]
+            if shown != gamestate.MASK_CHAR:
+                matches &= at.get(shown, 0)
+            else:
+                for letter in guessed:
+                    matches &= ~at.get(letter, 0)
+            if not matches:
+                break
+        return matches
+
+
+def index_for(words_name, length):
+    "Returns the LengthIndex of a dictionary, building it on first use"
+    key = (words_name or dictionary.DEFAULT, length)
+    index = _indexes.get(key)
+    if index is None:
+        with _lock:
+            index = _indexes.get(key)
+            if index is None:
+                words = list(dictionary.get(words_name).words(length))
+                index = LengthIndex(words)
+                _indexes[key] = index
+    return index
+
+
+def hint(words_name, pattern, guessed_mask):
+    """Returns (letter, candidates): the unguessed letter found in the most
+    dictionary words that fit pattern, and how many words fit. Falls back to
+    English letter frequency when no word fits."""
+    key = (words_name or dictionary.DEFAULT, pattern, guessed_mask)
+    cached = _hints.get(key)
+    if cached is not None:
+        return cached
+    guessed = [letter for letter in gamestate.LETTERS
+               if guessed_mask & gamestate.letter_bit(letter)]
+    unguessed = [letter for letter in ENGLISH_ORDER
+                 if not guessed_mask & gamestate.letter_bit(letter)]
+    index = index_for(words_name, len(pattern))
+    matches = index.candidates(pattern, guessed) if index.size else 0
+    best = unguessed[0] if unguessed else None
+    best_count = 0
+    if matches:
+        # Ties go to the more common letter in English
+        for letter in unguessed:
+            count = popcount(matches & index.contains.get(letter, 0))
+            if count > best_count:
+                best, best_count = letter, count
+    result = (best, popcount(matches))
+    _hints.set(key, result)
+    return result
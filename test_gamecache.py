@@ -0,0 +1,231 @@
+"""test_gamecache.py - Tests of cached moves and their writes to the datastore.
+
+They run on the datastore, memcache and task queue stubs of the App Engine
+SDK; point APPENGINE_SDK at it:
+
+    APPENGINE_SDK=~/google_appengine python -m unittest discover -p 'test_*.py'
+"""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+if os.environ.get('APPENGINE_SDK'):
+    sys.path.insert(0, os.environ['APPENGINE_SDK'])
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+
+try:
+    from google.appengine.ext import ndb
+except ImportError:
+    ndb = None
+else:
+    from google.appengine.api import memcache
+    from google.appengine.api.datastore_errors import Timeout, \
+        TransactionFailedError
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import testbed
+    import gamecache
+    import gamestate
+    from models import User, Game, Score, ActiveGames, UserStats
+
+try:
+    import api
+except ImportError:
+    api = None
+
+TARGET = 'hangman'
+ATTEMPTS = 5
+
+
+@unittest.skipIf(ndb is None, 'needs the App Engine SDK, see APPENGINE_SDK')
+class GameCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.addCleanup(self.testbed.deactivate)
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=ROOT)
+        self.taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        ndb.get_context().clear_cache()
+        user = User.create('player', 'player@example.com')
+        game = Game.new_game(user.key, ATTEMPTS)
+        game.target = TARGET
+        game.put()
+        self.game_key = game.key
+
+    def patch(self, owner, name, value):
+        "Replaces an attribute of a class or module for the current test"
+        original = owner.__dict__[name]
+        setattr(owner, name, value)
+        self.addCleanup(setattr, owner, name, original)
+
+    def stored(self):
+        return self.game_key.get(use_cache=False)
+
+    def moves(self, game):
+        return list(gamestate.decode_moves(game.moves))
+
+    def flush_tasks(self):
+        return self.taskqueue.get_filtered_tasks(url='/tasks/flush_game')
+
+    def guess(self, game, letter):
+        "Applies a guess the way a move does"
+        if not game.guess(letter):
+            game.attempts_remaining -= 1
+        if game.is_solved() or game.attempts_remaining < 1:
+            game.game_over = True
+
+
+class PersistTest(GameCacheTestCase):
+
+    def test_writes_moves_and_counters(self):
+        game = self.stored()
+        self.guess(game, 'z')
+        self.assertTrue(gamecache.persist(game))
+        self.assertEqual(self.moves(self.stored()), [('z', False)])
+        self.assertEqual(ActiveGames.totals(), (1, ATTEMPTS - 1))
+
+    def test_repeated_and_older_writes_change_nothing(self):
+        older = self.stored()
+        game = self.stored()
+        self.guess(game, 'z')
+        gamecache.persist(game)
+        self.assertTrue(gamecache.persist(game))
+        self.assertTrue(gamecache.persist(older))
+        self.assertEqual(self.moves(self.stored()), [('z', False)])
+        self.assertEqual(ActiveGames.totals(), (1, ATTEMPTS - 1))
+
+    def test_ended_game_is_scored_once(self):
+        game = self.stored()
+        for letter in 'hangm':
+            self.guess(game, letter)
+        self.assertTrue(game.game_over)
+        gamecache.persist(game)
+        gamecache.persist(game)
+        scores = Score.query().fetch()
+        self.assertEqual(len(scores), 1)
+        self.assertTrue(scores[0].won)
+        self.assertEqual(ActiveGames.totals(), (0, 0))
+        self.assertEqual(UserStats.query().get().wins, 1)
+
+    def test_stale_write_through_is_rejected(self):
+        first, second = self.stored(), self.stored()
+        self.guess(first, 'z')
+        gamecache.persist(first, base='')
+        self.guess(second, 'q')
+        self.assertRaises(TransactionFailedError, gamecache.persist, second,
+                          base='')
+        self.assertEqual(self.moves(self.stored()), [('z', False)])
+
+    def test_missing_game(self):
+        game = self.stored()
+        self.game_key.delete()
+        self.guess(game, 'z')
+        self.assertFalse(gamecache.persist(game))
+
+
+class FlushTest(GameCacheTestCase):
+
+    def test_writes_unwritten_moves(self):
+        session = gamecache.load(self.game_key)
+        self.guess(session.game, 'z')
+        self.assertTrue(session.save(session.game, 1))
+        self.assertTrue(gamecache.flush(self.game_key))
+        self.assertEqual(self.moves(self.stored()), [('z', False)])
+        self.assertEqual(gamecache.load(self.game_key).dirty, 0)
+
+    def test_ends_and_scores_a_game(self):
+        session = gamecache.load(self.game_key)
+        for letter in 'hangm':
+            self.guess(session.game, letter)
+        session.save(session.game, 1)
+        self.assertTrue(gamecache.flush(self.game_key))
+        self.assertTrue(self.stored().game_over)
+        self.assertEqual(Score.query().count(), 1)
+
+
+@unittest.skipIf(api is None, 'needs the Endpoints library of the SDK')
+class MoveTest(GameCacheTestCase):
+
+    def test_cached_move_is_not_written(self):
+        game, results = api._move(self.game_key, ['z'])
+        self.assertEqual(game.attempts_remaining, ATTEMPTS - 1)
+        self.assertEqual(self.moves(self.stored()), [])
+        self.assertEqual(gamecache.load(self.game_key).dirty, 1)
+        self.assertEqual(len(self.flush_tasks()), 1)
+        self.assertEqual(ActiveGames.totals(), (1, ATTEMPTS))
+
+    def test_lost_race_is_retried(self):
+        save = gamecache.Session.__dict__['save']
+        calls = []
+
+        def lose_first(session, game, dirty):
+            calls.append(dirty)
+            return len(calls) > 1 and save(session, game, dirty)
+        self.patch(gamecache.Session, 'save', lose_first)
+        game, results = api._move(self.game_key, ['z'])
+        self.assertEqual(len(calls), 2)
+        cached = gamecache.load(self.game_key)
+        self.assertEqual(self.moves(cached.game), [('z', False)])
+        self.assertEqual(cached.dirty, 1)
+
+    def test_ended_game_is_written(self):
+        game, results = api._move(self.game_key, list('hangm'),
+                                  skip_repeats=True)
+        self.assertTrue(game.game_over)
+        self.assertTrue(self.stored().game_over)
+        self.assertEqual(Score.query().count(), 1)
+        self.assertEqual(ActiveGames.totals(), (0, 0))
+        self.assertEqual(gamecache.load(self.game_key).dirty, 0)
+        self.assertEqual(self.flush_tasks(), [])
+
+    def test_failed_write_stays_unwritten(self):
+        persist = gamecache.persist
+
+        def fail(game, base=None):
+            raise Timeout()
+        self.patch(gamecache, 'persist', fail)
+        game, results = api._move(self.game_key, list('hangm'),
+                                  skip_repeats=True)
+        self.assertTrue(game.game_over)
+        self.assertFalse(self.stored().game_over)
+        self.assertTrue(gamecache.load(self.game_key).dirty)
+        self.assertEqual(len(self.flush_tasks()), 1)
+        # The queued flush ends and scores the game
+        gamecache.persist = persist
+        self.assertTrue(gamecache.flush(self.game_key))
+        self.assertTrue(self.stored().game_over)
+        self.assertEqual(Score.query().count(), 1)
+
+    def test_write_through_retries_after_concurrent_write(self):
+        # memcache can not hold the game, so every move is written through
+        self.patch(memcache.Client, 'add',
+                   lambda client, *args, **kwargs: False)
+        persist = gamecache.persist
+        calls = []
+
+        def concurrent(game, base=None):
+            if not calls:
+                other = self.stored()
+                self.guess(other, 'q')
+                # Another instance's write, unseen by this context's cache
+                other.put(use_cache=False)
+            calls.append(base)
+            return persist(game, base)
+        self.patch(gamecache, 'persist', concurrent)
+        game, results = api._move(self.game_key, ['z'])
+        self.assertEqual(calls, ['', gamestate.encode_move('q', False)])
+        self.assertEqual(results[0][:2], ('z', True))
+        self.assertEqual(self.moves(self.stored()),
+                         [('q', False), ('z', False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
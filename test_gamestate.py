@@ -0,0 +1,51 @@
+"""test_gamestate.py - Tests of the compact game state encoding.
+
+    python -m unittest discover -p 'test_*.py'
+"""
+
+import unittest
+
+import gamestate
+
+
+class GameStateTest(unittest.TestCase):
+
+    def test_letter_bits(self):
+        self.assertEqual(gamestate.letter_bit('a'), 1)
+        self.assertEqual(gamestate.letter_bit('z'), 1 << 25)
+        self.assertEqual(gamestate.word_mask('abba'),
+                         gamestate.letter_bit('a') | gamestate.letter_bit('b'))
+
+    def test_is_letter(self):
+        self.assertTrue(gamestate.is_letter('q'))
+        for char in ('Q', '1', '', 'ab', '-'):
+            self.assertFalse(gamestate.is_letter(char))
+
+    def test_mask_word(self):
+        mask = gamestate.word_mask('pl')
+        self.assertEqual(gamestate.mask_word('apple', mask), '-ppl-')
+        self.assertEqual(gamestate.mask_word('apple', 0), '-----')
+        self.assertEqual(gamestate.mask_word('apple',
+                                             gamestate.word_mask('aple')),
+                         'apple')
+
+    def test_moves_round_trip(self):
+        guesses = [('a', True), ('z', False), ('e', True), ('q', False)]
+        moves = ''.join(gamestate.encode_move(letter, correct)
+                        for letter, correct in guesses)
+        self.assertEqual(len(moves), len(guesses))
+        self.assertEqual(list(gamestate.decode_moves(moves)), guesses)
+
+    def test_decode_empty(self):
+        self.assertEqual(list(gamestate.decode_moves('')), [])
+        self.assertEqual(list(gamestate.decode_moves(None)), [])
+
+    def test_history_line(self):
+        self.assertEqual(gamestate.history_line('a', True),
+                         'Guess Made:<a>. Result: Correct Guess')
+        self.assertEqual(gamestate.history_line('b', False),
+                         'Guess Made:<b>. Result: Wrong Guess')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""test_models.py - Tests of the legacy Game upgrade.
+
+They need the App Engine SDK but no datastore; point APPENGINE_SDK at it:
+
+    APPENGINE_SDK=~/google_appengine python -m unittest discover -p 'test_*.py'
+"""
+
+import os
+import sys
+import unittest
+
+if os.environ.get('APPENGINE_SDK'):
+    sys.path.insert(0, os.environ['APPENGINE_SDK'])
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+
+try:
+    from google.appengine.ext import ndb
+except ImportError:
+    ndb = None
+else:
+    import gamestate
+    from models import Game
+
+
+@unittest.skipIf(ndb is None, 'needs the App Engine SDK, see APPENGINE_SDK')
+class GameUpgradeTest(unittest.TestCase):
+
+    def game(self, **values):
+        return Game(user=ndb.Key('User', 'player'), target='apple',
+                    attempts_allowed=5, attempts_remaining=4, **values)
+
+    def test_legacy_letters_are_encoded(self):
+        game = self.game(letters_guessed=['a', 'z', 'a', '1'],
+                         game_history=['Guess Made:<a>. Result: Correct'])
+        self.assertTrue(game.upgrade())
+        self.assertEqual(game.guessed_mask, gamestate.word_mask('az'))
+        self.assertEqual(list(gamestate.decode_moves(game.moves)),
+                         [('a', True), ('z', False)])
+        self.assertEqual(game.letters_guessed, [])
+        self.assertEqual(game.game_history, [])
+        self.assertIsNotNone(game.last_move_at)
+
+    def test_upgraded_game_is_unchanged(self):
+        game = self.game()
+        self.assertTrue(game.upgrade())
+        self.assertFalse(game.upgrade())
+
+    def test_guess_after_upgrade(self):
+        game = self.game(letters_guessed=['p'])
+        self.assertTrue(game.has_guessed('p'))
+        self.assertFalse(game.guess('x'))
+        self.assertTrue(game.guess('a'))
+        self.assertEqual(game.masked_word(), 'app--')
+        self.assertEqual(game.history(), [
+            gamestate.history_line('p', True),
+            gamestate.history_line('x', False),
+            gamestate.history_line('a', True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""test_scores.py - Tests of the packed Score sort key of the high score board.
+
+They need the App Engine SDK but no datastore; point APPENGINE_SDK at it:
+
+    APPENGINE_SDK=~/google_appengine python -m unittest discover -p 'test_*.py'
+"""
+
+import os
+import sys
+import unittest
+
+if os.environ.get('APPENGINE_SDK'):
+    sys.path.insert(0, os.environ['APPENGINE_SDK'])
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+
+try:
+    from google.appengine.ext import ndb
+except ImportError:
+    ndb = None
+else:
+    from models import Score, _score_sort_key
+
+
+@unittest.skipIf(ndb is None, 'needs the App Engine SDK, see APPENGINE_SDK')
+class ScoreSortKeyTest(unittest.TestCase):
+
+    def sort_key(self, won, guesses, performance):
+        return _score_sort_key(Score(won=won, guesses=guesses,
+                                     performance=performance))
+
+    def test_wins_first(self):
+        self.assertGreater(self.sort_key(True, 20, 0.0),
+                           self.sort_key(False, 1, 100.0))
+
+    def test_fewer_guesses_then_higher_performance(self):
+        self.assertGreater(self.sort_key(True, 3, 10.0),
+                           self.sort_key(True, 4, 90.0))
+        self.assertGreater(self.sort_key(True, 3, 60.5),
+                           self.sort_key(True, 3, 60.4))
+
+    def test_out_of_range_values_are_clamped(self):
+        self.assertEqual(self.sort_key(False, -1, -5.0),
+                         self.sort_key(False, 0, 0.0))
+        self.assertGreater(self.sort_key(True, 1 << 30, 0.0),
+                           self.sort_key(False, 0, 100.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,17 +4,16 @@ import logging
 from google.appengine.ext import ndb
 import endpoints
 
-def get_by_urlsafe(urlsafe, model):
-    """Returns an ndb.Model entity that the urlsafe key points to. Checks
-        that the type of entity returned is of the correct kind. Raises an
-        error if the key String is malformed or the entity is of the incorrect
-        kind
+
+def get_key_by_urlsafe(urlsafe, model):
+    """Returns the ndb.Key a urlsafe key string points to without fetching the
+        entity. Raises an error if the key String is malformed or is not of
+        the expected kind
     Args:
         urlsafe: A urlsafe key string
         model: The expected entity kind
     Returns:
-        The entity that the urlsafe Key string points to or None if no entity
-        exists.
+        The ndb.Key the urlsafe Key string points to.
     Raises:
         ValueError:"""
     try:
@@ -26,10 +25,52 @@ def get_by_urlsafe(urlsafe, model):
             raise endpoints.BadRequestException('Invalid Key')
         else:
             raise
+    if key.kind() != model._get_kind():
+        raise ValueError('Incorrect Kind')
+    return key
+
 
-    entity = key.get()
-    if not entity:
+def get_by_urlsafe_async(urlsafe, model):
+    """Starts fetching the ndb.Model entity that the urlsafe key points to and
+        returns an ndb.Future for it, so that other RPCs can run meanwhile.
+        The key is checked at once, as in get_by_urlsafe
+    Args:
+        urlsafe: A urlsafe key string
+        model: The expected entity kind
+    Returns:
+        An ndb.Future whose result is the entity or None if no entity exists.
+    Raises:
+        ValueError:"""
+    return get_key_by_urlsafe(urlsafe, model).get_async()
+
+
+def get_by_urlsafe(urlsafe, model):
+    """Returns an ndb.Model entity that the urlsafe key points to. Checks
+        that the type of entity returned is of the correct kind. Raises an
+        error if the key String is malformed or the entity is of the incorrect
+        kind
+    Args:
+        urlsafe: A urlsafe key string
+        model: The expected entity kind
+    Returns:
+        The entity that the urlsafe Key string points to or None if no entity
+        exists.
+    Raises:
+        ValueError:"""
+    return get_by_urlsafe_async(urlsafe, model).get_result()
+
+
+def get_cursor(urlsafe):
+    """Returns the ndb.Cursor a urlsafe cursor string points to, or None when
+        no cursor was given. Raises a BadRequestException if the string is
+        malformed.
+    Args:
+        urlsafe: A urlsafe cursor string as returned in a next_cursor field
+    Returns:
+        An ndb.Cursor or None."""
+    if not urlsafe:
         return None
-    if not isinstance(entity, model):
-        raise ValueError('Incorrect Kind')
-    return entity
+    try:
+        return ndb.Cursor(urlsafe=urlsafe)
+    except Exception:
+        raise endpoints.BadRequestException('Invalid Cursor')